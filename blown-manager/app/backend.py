@@ -162,15 +162,37 @@ def remove_with_backup(file_path: Path, project_name: str) -> Path:
 # ──────────────────────────────────────────────────────────────────────────────
 # Health
 # ──────────────────────────────────────────────────────────────────────────────
+def read_heartbeat(project_dir: Path):
+    """(record, mtime) from heartbeat.json or, for runners in journal mode, the last line of
+    heartbeat.jsonl; whichever was touched last. None if neither exists."""
+    found = []
+    for name in ("heartbeat.json", "heartbeat.jsonl"):
+        try:
+            found.append((os.stat(project_dir / name).st_mtime, name))
+        except FileNotFoundError:
+            pass
+    if not found:
+        return None
+    mtime, name = max(found)
+    with open(project_dir / name, "rb") as f:
+        if name.endswith(".jsonl"):
+            # Records are short; the last one is inside the final 4 KiB
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(0, size - 4096))
+            raw = f.read().rstrip(b"\n").rsplit(b"\n", 1)[-1]
+        else:
+            raw = f.read()
+    return json.loads(raw), mtime
+
 def check_project_health(project_name: str) -> Dict[str, Any]:
     project_dir = project_path(project_name)
-    heartbeat_file = project_dir / "heartbeat.json"
-    if not heartbeat_file.exists():
-        return {"healthy": False, "status": "no_heartbeat", "message": "No heartbeat file found"}
     try:
-        with open(heartbeat_file) as f:
-            data = json.load(f)
-        ts = data.get("ts", 0)
+        hb = read_heartbeat(project_dir)
+        if hb is None:
+            return {"healthy": False, "status": "no_heartbeat", "message": "No heartbeat file found"}
+        data, mtime = hb
+        # Runners only touch the file when nothing but ts would change, so mtime can be the fresher clock
+        ts = max(data.get("ts", 0), mtime)
         age = time.time() - ts
         if age > HEARTBEAT_TTL:
             return {
@@ -11,7 +11,7 @@ Design goals
   B) **Ledger Pairing (FIFO)** across a lookback window to reconstruct open inventory
 - One-cycle confirmation before first placement to avoid false triggers.
 - Respect manual order price overrides.
-- Print clear, human-readable logs that explain what the bot is doing.
+- Log clear, human-readable lines that explain what the bot is doing (written off-thread via a queue).
 
 Usage
   pip install openalgo python-dotenv
@@ -19,8 +19,8 @@ Usage
 
 Environment (defaults below can be overridden via .env)
   API_KEY
-  OPENALGO_HOST (default https://openalgo.rpinj.shop)
-  OPENALGO_WS   (default wss://openalgows.rpinj.shop)
+  OPENALGO_HOST or HOST_SERVER   (default https://openalgo.rpinj.shop)
+  OPENALGO_WS   or WEBSOCKET_URL (default wss://openalgows.rpinj.shop)
   OPENALGO_OPTION_PRODUCTS   NRML,MIS
   OPENALGO_OPTION_TICK       0.05
   AUTO_SELL_MARGIN_OPT       0.35
@@ -29,6 +29,8 @@ Environment (defaults below can be overridden via .env)
   LEDGER_USE_SYNTHETIC_BOOTSTRAP 1
   DISCREPANCY_PCT            0.5
   OPENALGO_WS_QUIET          0 (set 1 to silence library logs)
+  DEBUG                      0 (set 1 for per-cycle [DECIDE]/[SESSION] logs)
+  WS_SHARD_CAP               450 (max LTP subscriptions per WS connection; extra connections open on demand)
 
 Notes
 - We read **positionbook()** and **orderbook()**; for executions we try **tradebook()** then **orderhistory()**.
@@ -40,20 +42,19 @@ import os
 import time
 import threading
 import signal
+import random
 from typing import Dict, Tuple, List, Set, Optional
 import sys
+import queue
 import logging
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
-from openalgo import api
+from _client import get_client, new_client
 
 load_dotenv()
 
 # ───────────────────────────────── CONFIG (with defaults) ─────────────────────────────────
-API_KEY   = os.getenv("API_KEY", "").strip()
-HOST      = os.getenv("OPENALGO_HOST", "https://openalgo.rpinj.shop").strip()
-WS_URL    = os.getenv("OPENALGO_WS", "wss://openalgows.rpinj.shop").strip()
-
 OPTION_PRODUCTS = [p.strip().upper() for p in os.getenv("OPENALGO_OPTION_PRODUCTS", "NRML,MIS").split(",") if p.strip()]
 PLACE_PRODUCT   = OPTION_PRODUCTS[0] if OPTION_PRODUCTS else "NRML"
 
@@ -67,13 +68,26 @@ LEDGER_USE_SYNTHETIC_BOOTSTRAP = (os.getenv("LEDGER_USE_SYNTHETIC_BOOTSTRAP", "1
 DISCREPANCY_PCT = float(os.getenv("DISCREPANCY_PCT", "0.5"))  # percent
 
 OPENALGO_WS_QUIET = os.getenv("OPENALGO_WS_QUIET", "0").strip() in ("1", "true", "yes")
+DEBUG = os.getenv("DEBUG", "0").strip() in ("1", "true", "yes")
+WS_SHARD_CAP = int(os.getenv("WS_SHARD_CAP", "450"))
+POLL_SEC = 3.0
 
 # Limit scope strictly to options on derivative exchanges
 EXCHANGES = ["NFO", "BFO"]
 
-client = api(api_key=API_KEY, host=HOST, ws_url=WS_URL)
+client = get_client()
+
+# ───────────────────────────────── Logging ─────────────────────────────────
+# Supervisor threads only enqueue records; the listener thread does the stdout writes.
+log = logging.getLogger("autoseller")
+log.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+log.propagate = False
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+log.addHandler(QueueHandler(_log_queue))
+_log_stream = logging.StreamHandler(sys.stdout)
+_log_stream.setFormatter(logging.Formatter("%(message)s"))
+LOG_LISTENER = QueueListener(_log_queue, _log_stream)
 
-# ───────────────────────────────── WS logging ─────────────────────────────────
 if OPENALGO_WS_QUIET:
     for lname in ("openalgo", "websocket", "websocket-client"):
         logging.getLogger(lname).setLevel(logging.ERROR)
@@ -94,8 +108,20 @@ def is_option_symbol(symbol: str) -> bool:
     s = (symbol or "").upper().strip()
     return s.endswith("CE") or s.endswith("PE")
 
+def K(exch: str, sym: str) -> str:
+    """State key "EXCH:SYMBOL"; interned so repeated lookups reuse one cached hash."""
+    return sys.intern(f"{exch}:{sym}")
+
 # ───────────────────────────────── State ─────────────────────────────────
 class SymbolState:
+    __slots__ = (
+        "symbol", "exchange", "total_qty", "avg_price",
+        "open_sell_id", "open_sell_px", "open_sell_qty",
+        "tracking", "manual_override", "armed",
+        "session_id", "session_start", "session_buy_qty", "session_buy_value",
+        "last_exec_id", "session_populated", "zombie",
+    )
+
     def __init__(self, symbol: str, exchange: str):
         self.symbol = symbol
         self.exchange = exchange
@@ -115,6 +141,8 @@ class SymbolState:
         self.session_buy_value = 0.0
         self.last_exec_id = None  # if API provides incremental id
         self.session_populated = False
+        # Flat and untracked; swept from SYMBOLS after the supervisor pass
+        self.zombie = False
 
     def reset_session(self):
         self.session_id += 1
@@ -135,10 +163,20 @@ class SymbolState:
     def session_avg(self) -> Optional[float]:
         return (self.session_buy_value / self.session_buy_qty) if self.session_buy_qty > 0 else None
 
-SYMBOLS: Dict[Tuple[str, str], SymbolState] = {}
+SYMBOLS: Dict[str, SymbolState] = {}
 STATE_LOCK = threading.Lock()
 STOP = {"flag": False}
 
+# Wakes the supervisor out of its POLL_SEC wait (shutdown)
+CHANGED = threading.Event()
+# Set whenever a SymbolState.tracking flag flips so LTP subscriptions converge without the 10s wait
+SUBS_DIRTY = threading.Event()
+SUBS_SETTLE_SEC = 0.05
+# Keys whose tracking flag flipped since the last subscription pass; guarded by STATE_LOCK
+SUBS_PENDING: Set[str] = set()
+# LTP subscription ledger states (owned by the main thread)
+SUBSCRIBED, PENDING_ADD, PENDING_DEL = 0, 1, 2
+
 # Execution de-duplication cache
 PROCESSED_EXEC_IDS: Set[str] = set()
 MAX_EXEC_ID_CACHE = 10000
@@ -152,7 +190,7 @@ def try_call(fn_name: str, **kwargs):
     try:
         return fn(**kwargs) if kwargs else fn()
     except Exception as e:
-        print(f"[WARN] {fn_name} error: {e}")
+        log.warning("[WARN] %s error: %s", fn_name, e)
         return None
 
 # Normalizers to handle providers that return either dict-with-data or raw lists
@@ -272,7 +310,11 @@ def fetch_executions_lookback(days: int) -> List[dict]:
         try:
             exch = (r.get("exchange") or r.get("exch") or "").upper()
             sym  = (r.get("symbol") or r.get("trading_symbol") or r.get("tradingsymbol") or "").upper().strip()
-            if not (exch and sym):
+            # Drop non-option rows before any timestamp parsing or de-dup bookkeeping
+            if exch not in EXCHANGES or not sym.endswith(("CE", "PE")):
+                continue
+            product = (r.get("product") or r.get("product_type") or "").upper()
+            if product and product not in OPTION_PRODUCTS:
                 continue
             ts = (
                 r.get("time") or r.get("exchange_time") or r.get("transaction_time") or r.get("order_time")
@@ -306,7 +348,6 @@ def fetch_executions_lookback(days: int) -> List[dict]:
             if qty <= 0:
                 continue
             price = float(r.get("price") or r.get("average_price") or r.get("avg_price") or 0)
-            product = (r.get("product") or r.get("product_type") or "").upper()
             exec_id = str(r.get("exec_id") or r.get("trade_id") or r.get("exchange_order_id") or r.get("orderid") or r.get("order_id") or "") or None
 
             # de-dup
@@ -329,12 +370,12 @@ def fetch_executions_lookback(days: int) -> List[dict]:
 
 # ─────────────────────────────── Snapshots ───────────────────────────────
 
-def snapshot_option_positions() -> Dict[Tuple[str, str], Tuple[float, float]]:
-    """Return (exchange, symbol) -> (net_long_qty, long_avg_from_positive_legs).
+def snapshot_option_positions() -> Dict[str, Tuple[float, float]]:
+    """Return K(exchange, symbol) -> (net_long_qty, long_avg_from_positive_legs).
     Ignores shorts and ignores negative legs when computing avg.
     Accepts provider responses that are dicts or raw lists.
     """
-    rows: Dict[Tuple[str, str], List[Tuple[float, float]]] = {}
+    rows: Dict[str, List[Tuple[float, float]]] = {}
     pos_raw = try_call("positionbook")
     pos_list = norm_positions(pos_raw)
     for p in pos_list:
@@ -353,11 +394,11 @@ def snapshot_option_positions() -> Dict[Tuple[str, str], Tuple[float, float]]:
             if qty == 0:
                 continue
             avg = float(p.get("average_price", 0) or 0)
-            rows.setdefault((exch, sym), []).append((qty, avg))
+            rows.setdefault(K(exch, sym), []).append((qty, avg))
         except Exception:
             continue
 
-    merged: Dict[Tuple[str, str], Tuple[float, float]] = {}
+    merged: Dict[str, Tuple[float, float]] = {}
     for key, pairs in rows.items():
         net_qty = sum(q for q, _ in pairs)
         if net_qty > 0:  # only track longs
@@ -369,8 +410,8 @@ def snapshot_option_positions() -> Dict[Tuple[str, str], Tuple[float, float]]:
     return merged
 
 
-def snapshot_open_orders_options() -> Dict[Tuple[str, str], List[dict]]:
-    out: Dict[Tuple[str, str], List[dict]] = {}
+def snapshot_open_orders_options() -> Dict[str, List[dict]]:
+    out: Dict[str, List[dict]] = {}
     ob_raw = try_call("orderbook")
     orders = norm_orders(ob_raw)
     for o in orders:
@@ -387,7 +428,7 @@ def snapshot_open_orders_options() -> Dict[Tuple[str, str], List[dict]]:
             sym = (o.get("symbol", "") or "").upper().strip()
             if not is_option_symbol(sym):
                 continue
-            out.setdefault((exch, sym), []).append(o)
+            out.setdefault(K(exch, sym), []).append(o)
         except Exception:
             continue
     return out
@@ -428,21 +469,21 @@ def fifo_ledger_avg(execs: List[dict], exchange: str, symbol: str, opening_qty:
 
 # ─────────────────────────────── Actions ───────────────────────────────
 
-def cancel_existing_sells(exchange: str, symbol: str, open_orders: Dict[Tuple[str, str], List[dict]]):
-    for o in open_orders.get((exchange, symbol), []):
+def cancel_existing_sells(exchange: str, symbol: str, open_orders: Dict[str, List[dict]]):
+    for o in open_orders.get(K(exchange, symbol), []):
         if (o.get("action", "") or "").upper() == "SELL":
             oid = o.get("orderid") or o.get("order_id")
             status = (o.get("order_status", "") or o.get("status") or "").lower()
             # Don't cancel if already filled/cancelled
             if status not in ("open", "pending", "trigger_pending"):
-                print(f"[SKIP] Not cancelling {exchange}:{symbol} id={oid} (status={status})")
+                log.info("[SKIP] Not cancelling %s:%s id=%s (status=%s)", exchange, symbol, oid, status)
                 continue
             try:
                 client.cancelorder(order_id=str(oid))
-                print(f"[ACTION] Cancelled SELL {exchange}:{symbol} (order_id={oid})")
+                log.info("[ACTION] Cancelled SELL %s:%s (order_id=%s)", exchange, symbol, oid)
                 time.sleep(0.1)  # let cancellation propagate
             except Exception as e:
-                print(f"[WARN] Cancel failed for {exchange}:{symbol} id={oid}: {e}")
+                log.warning("[WARN] Cancel failed for %s:%s id=%s: %s", exchange, symbol, oid, e)
 
 
 def ensure_one_sell(exchange: str, symbol: str, qty: float, avg_price: float) -> Tuple[Optional[str], Optional[float], Optional[float]]:
@@ -465,40 +506,145 @@ def ensure_one_sell(exchange: str, symbol: str, qty: float, avg_price: float) ->
             or resp.get("data", {}).get("orderid")
             or resp.get("data", {}).get("order_id")
         )
-        print(f"[ACTION] Placed SELL {exchange}:{symbol} qty={qty} @ {px} (order_id={oid})")
+        log.info("[ACTION] Placed SELL %s:%s qty=%s @ %s (order_id=%s)", exchange, symbol, qty, px, oid)
         return (str(oid) if oid else None, px, qty)
     except Exception as e:
-        print(f"[ERROR] Failed to place SELL {exchange}:{symbol} qty={qty}: {e}")
+        log.error("[ERROR] Failed to place SELL %s:%s qty=%s: %s", exchange, symbol, qty, e)
         return (None, None, None)
 
 # ─────────────────────────────── WebSocket ───────────────────────────────
 
+# One instrument dict per subscribed K() key, reused across subscribe/unsubscribe calls
+_INSTR_CACHE: Dict[str, dict] = {}
+
+def _instr(key: str) -> dict:
+    d = _INSTR_CACHE.get(key)
+    if d is None:
+        exch, sym = key.split(":", 1)  # the only place a key is taken apart for the SDK
+        d = {"exchange": exch, "symbol": sym}
+        _INSTR_CACHE[key] = d
+    return d
+
+class LtpShards:
+    """Spread LTP subscriptions over several WS connections of at most WS_SHARD_CAP keys each.
+
+    The broker drops a single socket well before our symbol count can grow, so once every open
+    shard is full another client is connected. Keys stay on the shard they were first placed on;
+    an extra shard left with no keys is disconnected and its slot reused by the next one opened.
+    """
+
+    def __init__(self, first_client):
+        self.clients = [first_client]
+        self.members: List[Set[str]] = [set()]
+        self.shard_of: Dict[str, int] = {}
+
+    def _open_shard(self) -> int:
+        c = new_client()  # same env resolution as shard 0's get_client()
+        c.connect()
+        if None in self.clients:
+            i = self.clients.index(None)
+            self.clients[i] = c
+        else:
+            i = len(self.clients)
+            self.clients.append(c)
+            self.members.append(set())
+        log.info("[INFO] Opened WS shard #%s (cap %s)", i, WS_SHARD_CAP)
+        return i
+
+    def _place(self) -> int:
+        for i, m in enumerate(self.members):
+            if len(m) < WS_SHARD_CAP and self.clients[i] is not None:
+                return i
+        return self._open_shard()
+
+    def subscribe(self, keys) -> List[str]:
+        """Subscribe keys shard by shard, in order; returns the leading keys that found a shard."""
+        placed: List[str] = []
+        batches: Dict[int, List[str]] = {}
+        for k in keys:
+            try:
+                i = self._place()
+            except Exception as e:
+                log.warning("[WARN] WS shard connect failed: %s", e)
+                break
+            self.members[i].add(k)
+            self.shard_of[k] = i
+            placed.append(k)
+            batches.setdefault(i, []).append(k)
+        for i, ks in batches.items():
+            try:
+                self.clients[i].subscribe_ltp([_instr(k) for k in ks], on_data_received=on_tick)
+            except Exception as e:
+                log.warning("[WARN] subscribe_ltp error (shard %s): %s", i, e)
+        return placed
+
+    def unsubscribe(self, keys):
+        batches: Dict[int, List[str]] = {}
+        for k in keys:
+            i = self.shard_of.pop(k, None)
+            if i is None:
+                continue
+            self.members[i].discard(k)
+            batches.setdefault(i, []).append(k)
+        for i, ks in batches.items():
+            try:
+                self.clients[i].unsubscribe_ltp([_instr(k) for k in ks])
+            except Exception:
+                pass
+            if i and not self.members[i]:
+                self._close_shard(i)
+
+    def _close_shard(self, i: int):
+        try:
+            self.clients[i].disconnect()
+        except Exception:
+            pass
+        self.clients[i] = None
+        log.info("[INFO] Closed empty WS shard #%s", i)
+
+    def close(self):
+        self.unsubscribe(list(self.shard_of))
+        for c in self.clients:
+            if c is None:
+                continue
+            try:
+                c.disconnect()
+            except Exception:
+                pass
+
 def on_tick(data: dict):
     try:
         exch = (data.get("exchange") or "").upper()
         sym  = (data.get("symbol") or "").upper()
         ltp  = data.get("ltp")
         if exch in EXCHANGES and is_option_symbol(sym) and ltp is not None:
-            print(f"LTP {exch}:{sym} {ltp}")
+            log.info("LTP %s:%s %s", exch, sym, ltp)
     except Exception:
         pass
 
 # ─────────────────────────────── Supervisor ───────────────────────────────
 
+def set_tracking(key: str, st: SymbolState, on: bool):
+    """Flip st.tracking and queue the key for the next LTP subscription pass."""
+    st.tracking = on
+    with STATE_LOCK:
+        SUBS_PENDING.add(key)
+    SUBS_DIRTY.set()
+
 def supervisor():
     last_log_ts = 0
-    last_qty: Dict[Tuple[str, str], float] = {}
+    last_qty: Dict[str, float] = {}
 
     while not STOP["flag"]:
         try:
             totals = snapshot_option_positions()  # net long qty + pos-avg from positive legs
             open_orders = snapshot_open_orders_options()
 
-            # Seed new symbols
+            # Phase A: seed new symbols (the only insertion point, so phase B can iterate live)
             with STATE_LOCK:
                 for key in totals.keys():
                     if key not in SYMBOLS:
-                        exch, sym = key
+                        exch, sym = key.split(":", 1)
                         SYMBOLS[key] = SymbolState(sym, exch)
 
             # Fetch executions once per loop if enabled
@@ -506,11 +652,10 @@ def supervisor():
             if USE_EXECUTIONS:
                 execs = fetch_executions_lookback(LEDGER_LOOKBACK_DAYS)
 
-            # Per-symbol processing
-            for key in list(SYMBOLS.keys()):
-                exch, sym = key
+            # Phase B: per-symbol processing over the live dict; no keys are added or removed here
+            for key, st in SYMBOLS.items():
+                exch, sym = st.exchange, st.symbol
                 qty, pos_avg_pos_legs = totals.get(key, (0.0, 0.0))
-                st = SYMBOLS[key]
                 prev_qty = last_qty.get(key, 0.0)
 
                 # Session boundaries
@@ -522,23 +667,46 @@ def supervisor():
                         cancel_existing_sells(exch, sym, open_orders)
                         st.open_sell_id = st.open_sell_px = st.open_sell_qty = None
                         st.manual_override = False
-                        st.tracking = False
+                        set_tracking(key, st, False)
                         st.clear_session()
-                        print(f"[INFO] Flat → stop tracking {exch}:{sym}")
+                        log.info("[INFO] Flat → stop tracking %s:%s", exch, sym)
+                    st.zombie = True
                     last_qty[key] = 0.0
                     continue
+                st.zombie = False
 
                 # Start tracking if needed
                 if not st.tracking:
-                    st.tracking = True
+                    set_tracking(key, st, True)
                     st.reset_session()  # new session for 0→>0
-                    print(f"[SESSION] Start {exch}:{sym} qty={qty}")
+                    log.info("[SESSION] Start %s:%s qty=%s", exch, sym, qty)
 
                 # Qty increase → extend session, (re)compute avg from executions if available
                 if qty > prev_qty:
                     qty_increase = qty - prev_qty
                     st.armed = True
-                    print(f"[FLOW] Qty increased {exch}:{sym} +{qty_increase} (session extended)")
+                    log.info("[FLOW] Qty increased %s:%s +%s (session extended)", exch, sym, qty_increase)
+
+                # Fast path: nothing new to place and our SELL still sits at the target from the
+                # previous avg → skip both ledger rebuilds for this symbol.
+                if not st.armed and st.avg_price > 0:
+                    tentative_target = round_to_tick(st.avg_price + AUTO_SELL_MARGIN_OPT, TICK_SIZE_OPT)
+                    kept = None
+                    for o in open_orders.get(key, []):
+                        if ((o.get("action", "") or "").upper() == "SELL"
+                                and float(o.get("quantity", 0) or 0) == qty
+                                and abs(float(o.get("price", 0) or 0) - tentative_target) < 1e-6):
+                            kept = o
+                            break
+                    if kept is not None:
+                        st.total_qty = qty
+                        st.open_sell_id = kept.get("orderid") or kept.get("order_id")
+                        st.open_sell_px = tentative_target
+                        st.open_sell_qty = qty
+                        st.manual_override = False
+                        log.debug("[DECIDE] %s:%s keeping SELL id=%s @ %s (unchanged)", exch, sym, st.open_sell_id, tentative_target)
+                        last_qty[key] = qty
+                        continue
 
                 # ── Engine B: Ledger across lookback (bootstrap + carry-forward) ──
                 ledger_open_qty, ledger_open_avg = (0.0, None)
@@ -577,7 +745,7 @@ def supervisor():
                         session_avg = weighted_avg(queue)
                         st.session_buy_qty = sess_open_qty  # FIX 1: track session open qty
                         st.session_populated = True
-                        print(f"[SESSION] {exch}:{sym} session_open_qty={sess_open_qty} session_avg={session_avg}")
+                        log.debug("[SESSION] %s:%s session_open_qty=%s session_avg=%s", exch, sym, sess_open_qty, session_avg)
 
 
                 # Choose avg according to rules
@@ -594,20 +762,20 @@ def supervisor():
                     else:
                         chosen_avg = session_avg
                         source = "Session-Partial"
-                        print(f"[WARN] {exch}:{sym} session covers only {coverage_ratio:.1%} of position")
+                        log.warning("[WARN] %s:%s session covers only %.1f%% of position", exch, sym, coverage_ratio * 100)
                 elif ledger_open_avg is not None and ledger_open_qty >= qty * 0.95:
                     chosen_avg = ledger_open_avg
                     source = "Ledger"
                 else:
                     # Defer if too early in session
                     if USE_EXECUTIONS and st.session_start and (now_utc() - st.session_start).total_seconds() < DEFER_ON_START_SEC:
-                        print(f"[DEFER] {exch}:{sym} waiting for executions")
+                        log.info("[DEFER] %s:%s waiting for executions", exch, sym)
                         last_qty[key] = qty
                         continue
                     # Last resort: use position avg but flag as uncertain
                     chosen_avg = pos_avg_pos_legs
                     source = "Position-UNSAFE"
-                    print(f"[WARN] {exch}:{sym} using position avg (execution tracking failed!)")
+                    log.warning("[WARN] %s:%s using position avg (execution tracking failed!)", exch, sym)
 
                 st.total_qty = qty
                 st.avg_price = chosen_avg
@@ -634,18 +802,22 @@ def supervisor():
 
                 if matched_target:
                     st.armed = False
-                    print(f"[DECIDE] {exch}:{sym} keeping SELL id={st.open_sell_id} @ {st.open_sell_px} from {source} avg={chosen_avg}")
+                    log.debug("[DECIDE] %s:%s keeping SELL id=%s @ %s from %s avg=%s", exch, sym, st.open_sell_id, st.open_sell_px, source, chosen_avg)
                 elif found_open and st.manual_override:
                     st.armed = False
-                    print(f"[DECIDE] {exch}:{sym} user override detected; leaving order as-is (target {target_px}, source {source})")
+                    log.debug("[DECIDE] %s:%s user override detected; leaving order as-is (target %s, source %s)", exch, sym, target_px, source)
                 else:
                     if st.armed:
-                        print(f"[DECIDE] {exch}:{sym} placing SELL (armed) qty={qty} target={target_px} source={source} avg={chosen_avg}; ledger=({ledger_open_qty},{ledger_open_avg}) session={st.session_buy_qty if st.session_start else 0}")
+                        log.debug("[DECIDE] %s:%s placing SELL (armed) qty=%s target=%s source=%s avg=%s; ledger=(%s,%s) session=%s",
+                                  exch, sym, qty, target_px, source, chosen_avg, ledger_open_qty, ledger_open_avg,
+                                  st.session_buy_qty if st.session_start else 0)
                         oid, px, oq = ensure_one_sell(exch, sym, qty, chosen_avg)
                         st.open_sell_id, st.open_sell_px, st.open_sell_qty = oid, px, oq
                         st.armed = False
                     else:
-                        print(f"[DECIDE] {exch}:{sym} enforce/reprice SELL qty={qty} target={target_px} source={source} avg={chosen_avg}; ledger=({ledger_open_qty},{ledger_open_avg}) session={st.session_buy_qty if st.session_start else 0}")
+                        log.debug("[DECIDE] %s:%s enforce/reprice SELL qty=%s target=%s source=%s avg=%s; ledger=(%s,%s) session=%s",
+                                  exch, sym, qty, target_px, source, chosen_avg, ledger_open_qty, ledger_open_avg,
+                                  st.session_buy_qty if st.session_start else 0)
                         cancel_existing_sells(exch, sym, open_orders)
                         st.open_sell_id = st.open_sell_px = st.open_sell_qty = None
                         oid, px, oq = ensure_one_sell(exch, sym, qty, chosen_avg)
@@ -653,29 +825,38 @@ def supervisor():
 
                 last_qty[key] = qty
 
+            # Sweep flat symbols now that iteration is done
+            with STATE_LOCK:
+                for key in [k for k, st in SYMBOLS.items() if st.zombie]:
+                    del SYMBOLS[key]
+                    last_qty.pop(key, None)
+
             # periodic summary
             now = time.time()
             if now - last_log_ts >= 60:
-                print("---- SUMMARY (60s) ----")
+                log.info("---- SUMMARY (60s) ----")
                 for _, st in SYMBOLS.items():
-                    print(
-                        f"{st.exchange}:{st.symbol} qty={st.total_qty} avg={st.avg_price} "
-                        f"sell={'None' if not st.open_sell_id else f'id={st.open_sell_id}@{st.open_sell_px}x{st.open_sell_qty}'} "
-                        f"tracking={st.tracking} override={st.manual_override} session_start={st.session_start}"
+                    log.info(
+                        "%s:%s qty=%s avg=%s sell=%s tracking=%s override=%s session_start=%s",
+                        st.exchange, st.symbol, st.total_qty, st.avg_price,
+                        "None" if not st.open_sell_id else f"id={st.open_sell_id}@{st.open_sell_px}x{st.open_sell_qty}",
+                        st.tracking, st.manual_override, st.session_start,
                     )
-                print("-----------------------")
+                log.info("-----------------------")
                 last_log_ts = now
 
-            time.sleep(3)
+            CHANGED.wait(POLL_SEC)
+            CHANGED.clear()
         except Exception as e:
-            print("[ERROR] supervisor loop:", e)
-            time.sleep(3)
+            log.error("[ERROR] supervisor loop: %s", e)
+            time.sleep(POLL_SEC)
 
 
 # ─────────────────────────────── Main ───────────────────────────────
 
 def main():
-    print("🔁 OpenAlgo Python Bot is running.")
+    LOG_LISTENER.start()
+    log.info("🔁 OpenAlgo Python Bot is running.")
 
     # Seed state
     _ = snapshot_option_positions()
@@ -688,56 +869,71 @@ def main():
     try:
         client.connect()
     except Exception as e:
-        print("[ERROR] WebSocket connect failed:", e)
+        log.error("[ERROR] WebSocket connect failed: %s", e)
 
-    subscribed: Set[Tuple[str, str]] = set()
+    ledger: Dict[str, int] = {}  # K() key -> state; only SUBSCRIBED entries survive a pass
+    shards = LtpShards(client)
 
     try:
         while not STOP["flag"]:
+            # Short jittered settle so a burst of tracking flips collapses into one pass
+            time.sleep(random.uniform(0, SUBS_SETTLE_SEC))
+
+            # Clear before draining: a flip that lands from here on sets it again for the wait below
+            SUBS_DIRTY.clear()
+
+            # Drain only the keys that flipped: O(changes), not a diff over every tracked symbol
+            adds: List[str] = []
+            dels: List[str] = []
             with STATE_LOCK:
-                desired = {(st.exchange, st.symbol) for st in SYMBOLS.values() if st.tracking}
-
-            # subscribe new
-            to_add = desired - subscribed
-            if to_add:
-                instruments = [{"exchange": ex, "symbol": sym} for (ex, sym) in to_add]
-                try:
-                    client.subscribe_ltp(instruments, on_data_received=on_tick)
-                except Exception as e:
-                    print("[WARN] subscribe_ltp error:", e)
-                subscribed |= to_add
-
-            # unsubscribe removed
-            to_remove = subscribed - desired
-            if to_remove:
-                instruments = [{"exchange": ex, "symbol": sym} for (ex, sym) in to_remove]
-                try:
-                    client.unsubscribe_ltp(instruments)
-                except Exception:
-                    pass
-                subscribed -= to_remove
-
-            time.sleep(10)
+                for key in SUBS_PENDING:
+                    st = SYMBOLS.get(key)
+                    cur = ledger.get(key)
+                    if st is not None and st.tracking:
+                        if cur is None:
+                            ledger[key] = PENDING_ADD
+                            adds.append(key)
+                    elif cur == SUBSCRIBED:
+                        ledger[key] = PENDING_DEL
+                        dels.append(key)
+                SUBS_PENDING.clear()
+
+            # The SDK has no combined payload, so at most one subscribe and one unsubscribe per shard per pass
+            retry: List[str] = []
+            if adds:
+                placed = shards.subscribe(adds)
+                for k in placed:
+                    ledger[k] = SUBSCRIBED
+                for k in adds[len(placed):]:
+                    del ledger[k]
+                    retry.append(k)
+            if dels:
+                shards.unsubscribe(dels)
+                for k in dels:
+                    del ledger[k]
+                    _INSTR_CACHE.pop(k, None)
+            if retry:
+                # Unplaced keys (shard connect failed) are retried on the next pass, not immediately
+                with STATE_LOCK:
+                    SUBS_PENDING.update(retry)
+
+            SUBS_DIRTY.wait(timeout=10)
     except KeyboardInterrupt:
         pass
     finally:
-        if subscribed:
-            instruments = [{"exchange": ex, "symbol": sym} for (ex, sym) in subscribed]
-            try:
-                client.unsubscribe_ltp(instruments)
-            except Exception:
-                pass
-        try:
-            client.disconnect()
-        except Exception:
-            pass
+        shards.close()
         STOP["flag"] = True
+        CHANGED.set()
+        SUBS_DIRTY.set()
         t.join(timeout=5)
-        print("[INFO] Exited cleanly.")
+        log.info("[INFO] Exited cleanly.")
+        LOG_LISTENER.stop()
 
 
 if __name__ == "__main__":
     def _sigint(_sig, _frame):
         STOP["flag"] = True
+        CHANGED.set()
+        SUBS_DIRTY.set()
     signal.signal(signal.SIGINT, _sigint)
     main()
@@ -1,14 +1,6 @@
-from openalgo import api
-import os
-from dotenv import load_dotenv
+from _client import get_client
 
-load_dotenv()
-
-client = api(
-    api_key=os.getenv("API_KEY"),
-    host=os.getenv("HOST_SERVER"),
-    ws_url=os.getenv("WEBSOCKET_URL")
-)
+client = get_client()
 
 resp = client.holdings()
 print(resp)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Shared OpenAlgo client factory for library scripts.
+
+Every script used to run load_dotenv() + api(...) on its own, each with its own HTTP
+session. get_client() does that once per process and hands back the same client, so
+repeated tradebook()/positionbook()/holdings() calls reuse its warm connections.
+new_client() builds a separate one (e.g. an extra websocket) from the same settings.
+
+Environment (.env is loaded on first call)
+  API_KEY
+  OPENALGO_HOST or HOST_SERVER   (default https://openalgo.rpinj.shop)
+  OPENALGO_WS   or WEBSOCKET_URL (default wss://openalgows.rpinj.shop)
+
+This lives in library/shared/ so the managers never list it as a script. Scripts import
+it from wherever they run by having that dir on PYTHONPATH (the runner services in
+docker-compose.yml mount it and set PYTHONPATH=/library/shared).
+"""
+
+import os
+from functools import lru_cache
+
+from dotenv import load_dotenv
+from openalgo import api
+
+DEFAULT_HOST = "https://openalgo.rpinj.shop"
+DEFAULT_WS = "wss://openalgows.rpinj.shop"
+
+
+def new_client() -> api:
+    """A fresh, uncached client with the same env resolution as get_client()."""
+    load_dotenv()
+    api_key = os.getenv("API_KEY", "").strip()
+    host = (os.getenv("OPENALGO_HOST") or os.getenv("HOST_SERVER") or DEFAULT_HOST).strip()
+    ws_url = (os.getenv("OPENALGO_WS") or os.getenv("WEBSOCKET_URL") or DEFAULT_WS).strip()
+    return api(api_key=api_key, host=host, ws_url=ws_url)
+
+
+@lru_cache(maxsize=1)
+def get_client() -> api:
+    return new_client()
@@ -17,15 +17,19 @@ What it does:
 
 Notes:
 - No DB / file writes. Purely prints to console.
-- Requires environment variables: API_KEY, optionally OPENALGO_HOST, OPENALGO_WS
-- Install: pip install openalgo python-dotenv
+- Requires environment variables: API_KEY, optionally OPENALGO_HOST, OPENALGO_WS, HOLDINGS_TTL (default 5s)
+- Install: pip install openalgo python-dotenv pandas
 """
 
 import os
-from collections import defaultdict
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Dict, List, Tuple
+import pandas as pd
 from dotenv import load_dotenv
-from openalgo import api
+from _client import get_client
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Config
@@ -33,41 +37,51 @@ from openalgo import api
 
 EXCHANGES = {"NSE", "BSE"}
 PRODUCT = "CNC"  # Delivery product
+HOLDINGS_TTL = max(1, int(os.getenv("HOLDINGS_TTL", "5")))  # seconds a positionbook/holdings pair is reused
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Helpers
 # ──────────────────────────────────────────────────────────────────────────────
 
+# Where tradebook/orderhistory-like payloads keep their list, in probe order; () is a bare list.
+_EXEC_PATHS = (
+    (),
+    ("data",),
+    ("data", "trades"), ("data", "orders"), ("data", "executions"), ("data", "data"),
+    ("trades",), ("orders",), ("executions",),
+)
+
+
 def norm_execs(resp) -> List[dict]:
     """Normalize tradebook/orderhistory-like responses to a list of dicts."""
-    if resp is None:
-        return []
-    if isinstance(resp, list):
-        return resp
-    if isinstance(resp, dict):
-        data = resp.get("data")
-        if isinstance(data, list):
-            return data
-        if isinstance(data, dict):
-            # common nested containers: { data: { trades: [...] }}
-            for k in ("trades", "orders", "executions", "data"):
-                v = data.get(k)
-                if isinstance(v, list):
-                    return v
-        # some SDKs return at top-level
-        for k in ("trades", "orders", "executions"):
-            v = resp.get(k)
-            if isinstance(v, list):
-                return v
+    for path in _EXEC_PATHS:
+        cur = resp
+        for k in path:
+            cur = cur.get(k) if isinstance(cur, dict) else None
+        if isinstance(cur, list):
+            return cur
     return []
 
 
-def weighted_avg(pairs: List[Tuple[float, float]]) -> float:
-    """pairs: list of (qty, price) => returns weighted average"""
-    num = sum(q * p for q, p in pairs)
-    den = sum(q for q, _ in pairs)
-    return round((num / den), 2) if den > 0 else 0.0
+# Canonical tradebook column -> (aliases in priority order, default); first non-empty alias wins.
+CANON = {
+    "exchange": (("exchange", "exch"), ""),
+    "symbol": (("symbol", "trading_symbol", "tradingsymbol"), ""),
+    "side": (("transaction_type", "side", "action"), ""),
+    "product": (("product",), ""),
+    "qty": (("qty", "filled_quantity", "quantity"), 0),
+    "price": (("price", "average_price", "trade_price"), 0),
+}
+
+
+def canon_rows(rows: List[dict]) -> List[tuple]:
+    """One normalization pass over the raw rows: a tuple per row in CANON column order."""
+    spec = tuple(CANON.values())
+    return [
+        tuple(next((r[a] for a in aliases if r.get(a)), default) for aliases, default in spec)
+        for r in rows
+    ]
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -76,61 +90,70 @@ def weighted_avg(pairs: List[Tuple[float, float]]) -> float:
 
 def summarize_stock_trades(rows: List[dict]) -> Dict[Tuple[str, str], dict]:
     """Aggregate BUY/SELL counts, today's average buy price, and net quantity per stock symbol."""
-    agg: Dict[Tuple[str, str], dict] = defaultdict(lambda: {
-        "buys": 0,
-        "sells": 0,
-        "first_side": None,
-        "today_buy_qty": 0.0,
-        "today_sell_qty": 0.0,
-        "today_net_qty": 0.0,
-        "buy_trades": [],  # list of (qty, price) for weighted avg
-    })
-
-    # Preserve order of first appearance per symbol
-    first_seen_index: Dict[Tuple[str, str], int] = {}
-
-    for i, r in enumerate(rows):
-        exch = (r.get("exchange") or r.get("exch") or "").upper()
-        sym = (r.get("symbol") or r.get("trading_symbol") or r.get("tradingsymbol") or "").upper().strip()
-        side = (r.get("transaction_type") or r.get("side") or r.get("action") or "").upper()
-        prod = (r.get("product") or "").upper()
-        
-        qty = float(r.get("qty") or r.get("filled_quantity") or r.get("quantity") or 0) or 0.0
-        price = float(r.get("price") or r.get("average_price") or r.get("trade_price") or 0) or 0.0
-
-        # Filter: only NSE/BSE equity (CNC product)
-        if exch not in EXCHANGES or prod != PRODUCT:
-            continue
-        if side not in {"BUY", "SELL"} or qty <= 0:
-            continue
-
-        key = (exch, sym)
-        if key not in first_seen_index:
-            first_seen_index[key] = i
-            agg[key]["first_side"] = side
-
-        if side == "BUY":
-            agg[key]["buys"] += 1
-            agg[key]["today_buy_qty"] += qty
-            agg[key]["today_net_qty"] += qty
-            agg[key]["buy_trades"].append((qty, price))
-        else:
-            agg[key]["sells"] += 1
-            agg[key]["today_sell_qty"] += qty
-            agg[key]["today_net_qty"] -= qty
-
+    if not rows:
+        return {}
+    t = pd.DataFrame.from_records(canon_rows(rows), columns=list(CANON))
+    for col in ("exchange", "side", "product"):
+        t[col] = t[col].astype(str).str.upper()
+    t["symbol"] = t["symbol"].astype(str).str.upper().str.strip()
+    for col in ("qty", "price"):
+        t[col] = pd.to_numeric(t[col], errors="coerce").fillna(0.0)
+
+    # Filter: only NSE/BSE equity (CNC product), real BUY/SELL fills
+    t = t[t["exchange"].isin(EXCHANGES) & (t["product"] == PRODUCT)
+          & t["side"].isin({"BUY", "SELL"}) & (t["qty"] > 0)]
+    if t.empty:
+        return {}
+
+    is_buy = t["side"] == "BUY"
+    t = t.assign(
+        buy=is_buy.astype(int),
+        sell=(~is_buy).astype(int),
+        buy_qty=t["qty"].where(is_buy, 0.0),
+        sell_qty=t["qty"].where(~is_buy, 0.0),
+        buy_value=(t["qty"] * t["price"]).where(is_buy, 0.0),
+    )
+    # sort=False keeps symbols in order of first appearance, so "first" is the first trade's side
+    g = t.groupby(["exchange", "symbol"], sort=False).agg(
+        buys=("buy", "sum"),
+        sells=("sell", "sum"),
+        first_side=("side", "first"),
+        today_buy_qty=("buy_qty", "sum"),
+        today_sell_qty=("sell_qty", "sum"),
+        buy_value=("buy_value", "sum"),
+    )
+
+    agg: Dict[Tuple[str, str], dict] = {}
+    for (exch, sym), r in zip(g.index, g.itertuples(index=False)):
+        agg[(exch, sym)] = {
+            "buys": int(r.buys),
+            "sells": int(r.sells),
+            "first_side": r.first_side,
+            "today_buy_qty": float(r.today_buy_qty),
+            "today_sell_qty": float(r.today_sell_qty),
+            "today_net_qty": float(r.today_buy_qty - r.today_sell_qty),
+            "today_avg_buy": round(r.buy_value / r.today_buy_qty, 2) if r.today_buy_qty > 0 else 0.0,
+        }
     return agg
 
 
-def get_holdings(client) -> Dict[Tuple[str, str], dict]:
-    """Return current holdings/positions: (exchange, symbol) -> {qty, avg_price}"""
+def _fetch(fn, name: str):
+    """Call an SDK endpoint, returning None (with a warning) if it raises."""
+    try:
+        return fn()
+    except Exception as e:
+        print(f"[WARN] {name} error: {e}")
+        return None
+
+
+def _merge_positions(pos, h) -> Dict[Tuple[str, str], dict]:
+    """Merge already-fetched positionbook() and holdings() responses: (exchange, symbol) -> {qty, avg_price}.
+    Either response may be None when its fetch failed."""
     holdings = {}
     
-    # Try positions first (for intraday CNC stocks)
+    # Positions first (for intraday CNC stocks)
     try:
-        pos = client.positionbook()
-        
-        if pos.get("status") == "success":
+        if pos and pos.get("status") == "success":
             positions = pos.get("data", [])
             
             for p in positions:
@@ -148,11 +171,9 @@ def get_holdings(client) -> Dict[Tuple[str, str], dict]:
     except Exception as e:
         print(f"[WARN] positionbook error: {e}")
     
-    # Then try holdings (for carried forward stocks)
+    # Then holdings (for carried forward stocks)
     try:
-        h = client.holdings()
-        
-        if h.get("status") == "success":
+        if h and h.get("status") == "success":
             data = h.get("data", {})
             
             holdings_list = (
@@ -197,23 +218,37 @@ def get_holdings(client) -> Dict[Tuple[str, str], dict]:
     return holdings
 
 
+@lru_cache(maxsize=1)
+def _cached_holdings(client, bucket: int):
+    """(positionbook, holdings) responses, fetched concurrently; memoized per HOLDINGS_TTL time bucket."""
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        f_pb = ex.submit(_fetch, client.positionbook, "positionbook")
+        f_h = ex.submit(_fetch, client.holdings, "holdings")
+    return f_pb.result(), f_h.result()
+
+
+def get_holdings(client) -> Dict[Tuple[str, str], dict]:
+    """Return current holdings/positions: (exchange, symbol) -> {qty, avg_price}"""
+    pos, h = _cached_holdings(client, int(time.time() // HOLDINGS_TTL))
+    return _merge_positions(pos, h)
+
+
 def main():
     print("🔁 OpenAlgo Stock Tradebook Summarizer")
 
     load_dotenv()
-    API_KEY = os.getenv("API_KEY", "").strip()
-    HOST = os.getenv("OPENALGO_HOST", "https://openalgo.rpinj.shop").strip()
-    WS_URL = os.getenv("OPENALGO_WS", "wss://openalgows.rpinj.shop").strip()
-
-    if not API_KEY:
+    if not os.getenv("API_KEY", "").strip():
         print("[ERROR] API_KEY not set. Export API_KEY or create a .env file.")
         return
 
-    client = api(api_key=API_KEY, host=HOST, ws_url=WS_URL)
+    client = get_client()
 
-    # 1) Pull today's tradebook
+    # 1) Pull today's tradebook alongside positions + holdings (three independent round-trips)
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        f_tb = ex.submit(client.tradebook)
+        f_hold = ex.submit(get_holdings, client)
     try:
-        raw = client.tradebook()
+        raw = f_tb.result()
     except Exception as e:
         print(f"[ERROR] tradebook() failed: {e}")
         return
@@ -226,8 +261,8 @@ def main():
     # 2) Summarize today's stock trades
     summary = summarize_stock_trades(trades)
 
-    # 3) Get current holdings
-    holdings = get_holdings(client)
+    # 3) Merge current positions + holdings
+    holdings = f_hold.result()
 
     # 4) Merge and analyze
     all_symbols = set(summary.keys()) | set(holdings.keys())
@@ -236,9 +271,10 @@ def main():
         print("No stock trades or holdings found.")
         return
 
-    print("\n=== Stock Tradebook & Holdings Summary ===")
-    print(f"{'Exchange:Symbol':<30} | {'Buys':<4} {'Sells':<5} | {'Today Avg Buy':<14} | {'Today Net':<10} | {'Current Pos':<11} | {'Carried Fwd':<12} | {'Position Avg':<12} | Status")
-    print("-" * 165)
+    # Table is buffered and written in one go rather than one print() per row
+    out = ["", "=== Stock Tradebook & Holdings Summary ==="]
+    out.append(f"{'Exchange:Symbol':<30} | {'Buys':<4} {'Sells':<5} | {'Today Avg Buy':<14} | {'Today Net':<10} | {'Current Pos':<11} | {'Carried Fwd':<12} | {'Position Avg':<12} | Status")
+    out.append("-" * 165)
 
     fresh_count = 0
     partial_count = 0
@@ -253,17 +289,18 @@ def main():
             "today_buy_qty": 0.0,
             "today_sell_qty": 0.0,
             "today_net_qty": 0.0,
-            "buy_trades": [],
+            "today_avg_buy": 0.0,
         })
         
         h = holdings.get(key, {"qty": 0.0, "avg_price": 0.0})
 
-        today_avg_buy = weighted_avg(s["buy_trades"]) if s["buy_trades"] else 0.0
+        today_avg_buy = s["today_avg_buy"]
         today_net = s["today_net_qty"]
         current_pos = h["qty"]  # Keep sign: positive = long, negative = short
         position_avg = h["avg_price"]
         
-        # Calculate carried forward quantity
+        # Calculate carried forward quantity (holdings - today's net)
+        carried_fwd = current_pos - today_net
         # For sold holdings: if current_pos is negative and today_net is also negative,
         # it means we sold carried-forward holdings
         if current_pos < 0 and today_net < 0:
@@ -298,18 +335,19 @@ def main():
 
         label = f"{exch}:{sym}"
         
-        print(f"{label:<30} | {s['buys']:<4} {s['sells']:<5} | "
-              f"₹{today_avg_buy:>12.2f} | {today_net:>9.0f} | "
-              f"{current_pos:>10.0f} | {carried_fwd:>11.0f} | "
-              f"₹{position_avg:>10.2f} | {status}")
-
-    print("-" * 165)
-    print(f"Total symbols: {len(all_symbols)}")
-    print(f"  • Fresh (all bought today): {fresh_count}")
-    print(f"  • Partial (some carried forward): {partial_count}")
-    print(f"  • Sold CF (holdings sold today): {sold_count - (len([k for k, v in holdings.items() if v['qty'] == 0 and summary.get(k, {}).get('today_net_qty', 0) == 0]))}")
-    print(f"  • Short positions: {short_count}")
-    print(f"  • Closed/squared off: {len([k for k, v in holdings.items() if v['qty'] == 0 and summary.get(k, {}).get('today_net_qty', 0) == 0])}")
+        out.append(f"{label:<30} | {s['buys']:<4} {s['sells']:<5} | "
+                   f"₹{today_avg_buy:>12.2f} | {today_net:>9.0f} | "
+                   f"{current_pos:>10.0f} | {carried_fwd:>11.0f} | "
+                   f"₹{position_avg:>10.2f} | {status}")
+
+    out.append("-" * 165)
+    out.append(f"Total symbols: {len(all_symbols)}")
+    out.append(f"  • Fresh (all bought today): {fresh_count}")
+    out.append(f"  • Partial (some carried forward): {partial_count}")
+    out.append(f"  • Sold CF (holdings sold today): {sold_count - (len([k for k, v in holdings.items() if v['qty'] == 0 and summary.get(k, {}).get('today_net_qty', 0) == 0]))}")
+    out.append(f"  • Short positions: {short_count}")
+    out.append(f"  • Closed/squared off: {len([k for k, v in holdings.items() if v['qty'] == 0 and summary.get(k, {}).get('today_net_qty', 0) == 0])}")
+    sys.stdout.write("\n".join(out) + "\n")
 
 
 if __name__ == "__main__":
@@ -1,10 +1,14 @@
+import hashlib
 import os
+import re
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException, Body
-from fastapi.responses import HTMLResponse, JSONResponse
+import orjson
+from fastapi import FastAPI, HTTPException, Body, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -16,8 +20,24 @@ PROJECT_NAMES_ENV = os.getenv("PROJECT_NAMES", "").strip()
 
 MAIN_GUARD = "main.py"
 PY_SUFFIX = ".py"
+# Plain `*.py` basename: no separator, no `..` anywhere, one C-level match per request. Any other
+# character (spaces etc.) is allowed, as before, so every file list_py_files shows can be acted on
+_NAME_RE = re.compile(r"^(?!.*\.\.)[^/\x00]*\.py\Z", re.S)
 
-app = FastAPI(title="Cosmic-Infra Master Manager", version="1.0")
+# Project names: fixed list from env (parsed once), else PROJECTS_DIR subdirs cached by dir mtime
+_ENV_PROJECTS = [n.strip() for n in PROJECT_NAMES_ENV.split(",") if n.strip()]
+_PROJ_CACHE = {"mtime": None, "names": []}
+_LIB_CACHE = {"mtime": None, "files": []}
+
+
+class ORJSONResponse(JSONResponse):
+    """Default response class: orjson encodes our list-of-str payloads in C."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+app = FastAPI(title="Cosmic-Infra Master Manager", version="1.0", default_response_class=ORJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -37,37 +57,52 @@ def ensure_dir(p: Path, role: str):
 
 
 def valid_basename(name: str) -> str:
-    # Disallow traversal and subpaths
-    base = os.path.basename(name)
-    if base != name:
-        raise HTTPException(status_code=400, detail="Invalid filename (subpath not allowed)")
-    if ".." in base:
-        raise HTTPException(status_code=400, detail="Invalid filename (.. not allowed)")
-    if not base.endswith(PY_SUFFIX):
-        raise HTTPException(status_code=400, detail="Only .py files are allowed")
-    return base
+    # Disallow traversal, subpaths and anything but a plain .py name
+    if not _NAME_RE.match(name):
+        raise HTTPException(status_code=400, detail="Invalid filename (plain *.py name only)")
+    return name
 
 
 def list_py_files(dir_path: Path, include_main: bool = False) -> List[str]:
-    if not dir_path.exists():
-        return []
+    # scandir hands back name + d_type from getdents, so regular files need no extra stat
     files = []
-    for p in sorted(dir_path.iterdir()):
-        if p.is_file() and p.suffix == PY_SUFFIX:
-            if not include_main and p.name == MAIN_GUARD:
-                continue
-            files.append(p.name)
+    try:
+        with os.scandir(dir_path) as it:
+            for e in it:
+                if e.name.endswith(PY_SUFFIX) and e.is_file():
+                    if not include_main and e.name == MAIN_GUARD:
+                        continue
+                    files.append(e.name)
+    except FileNotFoundError:
+        return []
+    files.sort()
     return files
 
 
 def get_projects() -> List[str]:
     if PROJECT_NAMES_ENV:
-        names = [n.strip() for n in PROJECT_NAMES_ENV.split(",") if n.strip()]
-    else:
-        if not PROJECTS_DIR.exists():
-            return []
-        names = [p.name for p in sorted(PROJECTS_DIR.iterdir()) if p.is_dir()]
-    return names
+        return _ENV_PROJECTS
+    try:
+        mtime = os.stat(PROJECTS_DIR).st_mtime_ns
+        if mtime != _PROJ_CACHE["mtime"]:
+            with os.scandir(PROJECTS_DIR) as it:
+                _PROJ_CACHE["names"] = sorted(e.name for e in it if e.is_dir())
+            _PROJ_CACHE["mtime"] = mtime
+    except FileNotFoundError:
+        return []
+    return _PROJ_CACHE["names"]
+
+
+def library_files() -> List[str]:
+    # Library is mounted read-only; re-list only when its mtime moves
+    try:
+        mtime = os.stat(LIBRARY_DIR).st_mtime_ns
+    except FileNotFoundError:
+        return []
+    if mtime != _LIB_CACHE["mtime"]:
+        _LIB_CACHE["files"] = list_py_files(LIBRARY_DIR, include_main=True)
+        _LIB_CACHE["mtime"] = mtime
+    return _LIB_CACHE["files"]
 
 
 def project_path(name: str) -> Path:
@@ -78,9 +113,29 @@ def project_path(name: str) -> Path:
     return candidates[name]
 
 
+def _clear_one(proj_dir) -> int:
+    """Unlink every assigned script in one project dir (main.py stays); returns how many went."""
+    count = 0
+    try:
+        it = os.scandir(proj_dir)
+    except FileNotFoundError:
+        return 0
+    with it:
+        for e in it:
+            if e.name.endswith(PY_SUFFIX) and e.name != MAIN_GUARD and e.is_file():
+                try:
+                    os.unlink(e.path)
+                except FileNotFoundError:
+                    continue  # already gone (deleted meanwhile); the rest still go
+                count += 1
+    return count
+
+
 def atomic_copy(src: Path, dst: Path):
+    # Content only: copyfile uses sendfile/copy_file_range on Linux and skips copystat,
+    # whose extra syscalls outweigh the copy for small scripts.
     tmp = dst.with_name(f".{dst.name}.tmp")
-    shutil.copy2(src, tmp)
+    shutil.copyfile(src, tmp)
     os.replace(tmp, dst)
 
 
@@ -88,8 +143,12 @@ def atomic_copy(src: Path, dst: Path):
 # Routes: UI
 # ──────────────────────────────────────────────────────────────────────────────
 @app.get("/", response_class=HTMLResponse)
-async def ui_index():
-    return HTML
+async def ui_index(request: Request):
+    # Page is static for the life of the process: revalidate by ETag, 304 with no body on repeat loads
+    if request.headers.get("if-none-match") == _ETAG:
+        return Response(status_code=304, headers={"ETag": _ETAG})
+    return Response(content=_HTML_BYTES, media_type="text/html",
+                    headers={"ETag": _ETAG, "Cache-Control": "public, max-age=60"})
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -98,7 +157,7 @@ async def ui_index():
 @app.get("/api/library")
 async def api_library():
     ensure_dir(LIBRARY_DIR, "library")
-    return {"files": list_py_files(LIBRARY_DIR, include_main=True)}
+    return {"files": library_files()}
 
 
 @app.get("/api/projects")
@@ -107,6 +166,16 @@ async def api_projects():
     return {"projects": get_projects()}
 
 
+@app.get("/api/all")
+async def api_all():
+    # Library + every project's files in one round-trip (the UI renders from this alone)
+    ensure_dir(PROJECTS_DIR, "projects")
+    return {
+        "library": library_files(),
+        "projects": [{"name": n, "files": list_py_files(PROJECTS_DIR / n)} for n in get_projects()],
+    }
+
+
 @app.get("/api/project/{name}/files")
 async def api_project_files(name: str):
     ensure_dir(PROJECTS_DIR, "projects")
@@ -128,16 +197,14 @@ async def api_assign(payload: dict = Body(...)):
     if fname == MAIN_GUARD:
         raise HTTPException(status_code=403, detail="Cannot assign main.py")
 
-    src = (LIBRARY_DIR / fname).resolve()
+    # LIBRARY_DIR/PROJECTS_DIR are resolved at import and valid_basename rejects subpaths and "..",
+    # so a plain join stays inside the parent without a per-request realpath walk.
+    src = LIBRARY_DIR / fname
     if not src.exists():
         raise HTTPException(status_code=404, detail="Library file not found")
 
     proj_dir = project_path(project)
-    dst = (proj_dir / fname).resolve()
-
-    # Ensure dst is within project dir
-    if proj_dir not in dst.parents:
-        raise HTTPException(status_code=400, detail="Invalid destination path")
+    dst = proj_dir / fname
 
     if dst.exists():
         raise HTTPException(status_code=409, detail="File already exists in project")
@@ -158,15 +225,11 @@ async def api_delete_file(name: str, filename: str):
         raise HTTPException(status_code=403, detail="Refusing to delete main.py")
 
     proj_dir = project_path(name)
-    target = (proj_dir / fname).resolve()
+    target = proj_dir / fname  # contained by valid_basename, see api_assign
 
     if not target.exists():
         raise HTTPException(status_code=404, detail="File not found")
 
-    # Ensure within project
-    if proj_dir not in target.parents:
-        raise HTTPException(status_code=400, detail="Invalid target path")
-
     try:
         target.unlink()
     except Exception as e:
@@ -179,30 +242,23 @@ async def api_delete_file(name: str, filename: str):
 async def api_clear_project(name: str):
     ensure_dir(PROJECTS_DIR, "projects")
     proj_dir = project_path(name)
-    count = 0
-    for p in proj_dir.iterdir():
-        if p.is_file() and p.suffix == PY_SUFFIX and p.name != MAIN_GUARD:
-            try:
-                p.unlink()
-                count += 1
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Clear failed on {p.name}: {e}")
+    try:
+        count = _clear_one(proj_dir)
+    except Exception as ex:
+        raise HTTPException(status_code=500, detail=f"Clear failed on {name}: {ex}")
     return {"ok": True, "removed": count}
 
 
 @app.post("/api/stop_all")
 async def api_stop_all():
     ensure_dir(PROJECTS_DIR, "projects")
-    removed_total = 0
-    for name in get_projects():
-        proj_dir = project_path(name)
-        for p in proj_dir.iterdir():
-            if p.is_file() and p.suffix == PY_SUFFIX and p.name != MAIN_GUARD:
-                try:
-                    p.unlink()
-                    removed_total += 1
-                except Exception as e:
-                    raise HTTPException(status_code=500, detail=f"StopAll failed on {name}/{p.name}: {e}")
+    # Project dirs are independent, so their unlinks overlap across a small pool
+    dirs = [os.path.join(PROJECTS_DIR, n) for n in get_projects()]
+    try:
+        with ThreadPoolExecutor(max_workers=8) as ex:
+            removed_total = sum(ex.map(_clear_one, dirs))
+    except Exception as ex:
+        raise HTTPException(status_code=500, detail=f"StopAll failed: {ex}")
     return {"ok": True, "removed": removed_total}
 
 
@@ -275,11 +331,10 @@ function fileItem(name, delCb){
   return li;
 }
 
-async function loadLibrary(){
-  const data = await jget('/api/library');
+function renderLibrary(files){
   const ul = document.getElementById('library');
   ul.innerHTML = '';
-  data.files.forEach(f=>{
+  files.forEach(f=>{
     const li = document.createElement('li');
     li.className='file'; li.draggable = true; li.textContent = f;
     li.addEventListener('dragstart', (e)=>{
@@ -300,25 +355,24 @@ function dropZoneEl(project){
     try{
       await jpost('/api/assign', {project, filename});
       msg(`Assigned ${filename} → ${project}`);
-      await renderProjects();
+      await refresh();
     }catch(err){ msg(err.message || 'Assign failed'); }
   });
   return dz;
 }
 
-async function renderProjects(){
+function renderProjects(projects){
   const grid = document.getElementById('projects');
-  const data = await jget('/api/projects');
   grid.innerHTML='';
-  for (const name of data.projects){
+  for (const {name, files} of projects){
     const card = document.createElement('section'); card.className='card';
     const head = document.createElement('h3');
     const controls = document.createElement('div'); controls.className='row';
 
     const btnRefresh = document.createElement('button'); btnRefresh.textContent='Refresh';
-    btnRefresh.onclick = ()=>renderProjects();
+    btnRefresh.onclick = ()=>refresh();
     const btnClear = document.createElement('button'); btnClear.textContent='Clear Project';
-    btnClear.onclick = async ()=>{ try{ await jpost(`/api/project/${name}/clear`); msg(`Cleared ${name}`); await renderProjects(); }catch(e){ msg(e.message); } };
+    btnClear.onclick = async ()=>{ try{ await jpost(`/api/project/${name}/clear`); msg(`Cleared ${name}`); await refresh(); }catch(e){ msg(e.message); } };
 
     controls.appendChild(btnRefresh); controls.appendChild(btnClear);
     head.innerHTML = `<span>${name}</span>`; head.appendChild(controls);
@@ -327,15 +381,10 @@ async function renderProjects(){
     content.appendChild(dropZoneEl(name));
 
     const ul = document.createElement('ul');
-    try{
-      const files = await jget(`/api/project/${name}/files`);
-      files.files.forEach(f=>{
-        const li = fileItem(f, async(fn)=>{ try{ await jdel(`/api/project/${name}/file/${encodeURIComponent(fn)}`); msg(`Removed ${fn} from ${name}`); await renderProjects(); }catch(e){ msg(e.message); } });
-        ul.appendChild(li);
-      });
-    }catch(e){
-      const em = document.createElement('div'); em.className='muted'; em.textContent = e.message || 'Error loading files'; content.appendChild(em);
-    }
+    files.forEach(f=>{
+      const li = fileItem(f, async(fn)=>{ try{ await jdel(`/api/project/${name}/file/${encodeURIComponent(fn)}`); msg(`Removed ${fn} from ${name}`); await refresh(); }catch(e){ msg(e.message); } });
+      ul.appendChild(li);
+    });
 
     content.appendChild(ul);
     card.appendChild(head); card.appendChild(content);
@@ -343,13 +392,25 @@ async function renderProjects(){
   }
 }
 
+// One request fills both panels
+async function refresh(){
+  try{
+    const data = await jget('/api/all');
+    renderLibrary(data.library);
+    renderProjects(data.projects);
+  }catch(e){ msg(e.message || 'Load failed'); }
+}
+
 // Global buttons
- document.getElementById('refreshAll').onclick = ()=>{ loadLibrary(); renderProjects(); };
- document.getElementById('stopAll').onclick = async ()=>{ try{ await jpost('/api/stop_all'); msg('Stopped all (cleared .py except main.py)'); await renderProjects(); }catch(e){ msg(e.message); } };
+ document.getElementById('refreshAll').onclick = ()=>refresh();
+ document.getElementById('stopAll').onclick = async ()=>{ try{ await jpost('/api/stop_all'); msg('Stopped all (cleared .py except main.py)'); await refresh(); }catch(e){ msg(e.message); } };
 
 // Initial load
-loadLibrary().then(renderProjects);
+refresh();
 </script>
 </body>
 </html>
-""")
\ No newline at end of file
+""")
+
+_HTML_BYTES = HTML.body
+_ETAG = '"' + hashlib.sha256(_HTML_BYTES).hexdigest()[:16] + '"'
@@ -3,10 +3,17 @@ import os
 import time
 import json
 import signal
+import selectors
 import subprocess
+import sys
 import threading
 from pathlib import Path
 
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # no inotify binding → fall back to polling
+    INotify = None
+
 # ──────────────────────────────────────────────────────────────────────────────
 # Paths & globals
 # ──────────────────────────────────────────────────────────────────────────────
@@ -14,6 +21,10 @@ WATCH_DIR = Path(__file__).parent.resolve()
 STOP_DIR = WATCH_DIR / "stop"            # manager will drop *.kill files here
 PAUSE_MARKER = WATCH_DIR / "pause.marker"  # manager creates this to pause
 HEARTBEAT_FILE = WATCH_DIR / "heartbeat.json"
+SELF_NAME = Path(__file__).name
+POLL_SEC = 2  # only used when inotify is unavailable
+RESTART_MIN_SEC = 1.0   # first restart delay for a script that exits on its own
+RESTART_MAX_SEC = 60.0  # backoff cap; a run at least this long resets the delay
 
 # Map: filename -> subprocess.Popen
 processes = {}
@@ -21,51 +32,92 @@ lock = threading.Lock()
 shutdown = False
 paused = False
 
+# Crash/exit restart bookkeeping (main thread only)
+started_at = {}        # filename -> monotonic start time
+restart_delays = {}    # filename -> last backoff used
+pending_restarts = {}  # filename -> monotonic time the restart is due
+child_exited = False   # set from the SIGCHLD handler; the main loop does the reaping
+# Scripts stopped by a kill marker stay down until their file is written again or removed:
+# filename -> st_mtime_ns at kill time (main thread only)
+killed = {}
+
 # ──────────────────────────────────────────────────────────────────────────────
 # Discovery & process control
 # ──────────────────────────────────────────────────────────────────────────────
 def discover_python_files():
     """All .py in WATCH_DIR except this file (main.py)."""
-    return [f for f in WATCH_DIR.glob("*.py") if f.name != Path(__file__).name]
+    return [f for f in WATCH_DIR.glob("*.py") if f.name != SELF_NAME]
 
 def start_process(filepath: Path):
     with lock:
         if filepath.name in processes:
             return
         print(f"[INFO] Starting {filepath.name} ...", flush=True)
+        # Same interpreter as the runner, unbuffered for docker logs, and in its own session so
+        # terminal signals don't hit it directly and stop_process can take down its whole group.
         proc = subprocess.Popen(
-            ["python", str(filepath)],
+            [sys.executable, "-u", str(filepath)],
             stdout=None,  # inherit → visible in docker logs
-            stderr=None
+            stderr=None,
+            start_new_session=True,
+            close_fds=True,
         )
         processes[filepath.name] = proc
+        started_at[filepath.name] = time.monotonic()
+
+def _signal_group(proc, sig):
+    """Signal the child's whole session (it is its group leader) so grandchildren go too."""
+    try:
+        os.killpg(proc.pid, sig)
+    except ProcessLookupError:
+        pass
 
 def stop_process(filename: str, reason: str = "regular"):
+    pending_restarts.pop(filename, None)
     with lock:
         proc = processes.pop(filename, None)
     if proc is None:
         return
     print(f"[INFO] Stopping {filename} ({reason}) ...", flush=True)
     try:
-        proc.terminate()
+        _signal_group(proc, signal.SIGTERM)
         proc.wait(timeout=5)
     except subprocess.TimeoutExpired:
-        proc.kill()
+        _signal_group(proc, signal.SIGKILL)
         proc.wait()
     except Exception as e:
         print(f"[WARN] Error stopping {filename}: {e}", flush=True)
 
 def reap_exited_children():
-    """Remove from table any processes that have naturally exited."""
+    """Drop processes that exited on their own and schedule a restart with backoff."""
     dead = []
     with lock:
         for name, proc in processes.items():
             if proc.poll() is not None:
-                dead.append(name)
-    for name in dead:
-        print(f"[INFO] {name} exited with code {processes[name].returncode}", flush=True)
-        with lock:
+                dead.append((name, proc.returncode))
+        for name, _ in dead:
             processes.pop(name, None)
+    now = time.monotonic()
+    for name, code in dead:
+        ran = now - started_at.pop(name, now)
+        if ran >= RESTART_MAX_SEC:
+            delay = RESTART_MIN_SEC
+        else:
+            delay = min(restart_delays.get(name, RESTART_MIN_SEC / 2) * 2, RESTART_MAX_SEC)
+        restart_delays[name] = delay
+        pending_restarts[name] = now + delay
+        print(f"[INFO] {name} exited with code {code}; restarting in {delay:.0f}s", flush=True)
+
+def restart_due():
+    """Relaunch exited scripts whose backoff has elapsed, if their file is still there."""
+    now = time.monotonic()
+    for name, due in list(pending_restarts.items()):
+        if due > now:
+            continue
+        del pending_restarts[name]
+        path = WATCH_DIR / name
+        if not paused and path.exists():
+            start_process(path)
 
 def check_pause_state():
     """Check if pause marker exists and update global state."""
@@ -76,6 +128,7 @@ def check_pause_state():
     # If we just got paused, stop all processes
     if paused and not was_paused:
         print("[INFO] Pause marker detected - stopping all processes...", flush=True)
+        pending_restarts.clear()
         with lock:
             names = list(processes.keys())
         for fname in names:
@@ -85,6 +138,12 @@ def check_pause_state():
     if not paused and was_paused:
         print("[INFO] Pause marker removed - resuming operations...", flush=True)
 
+def _mtime_ns(path: Path) -> int:
+    try:
+        return path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
 def sync_processes():
     """Start new files, stop deleted ones (unless paused)."""
     # Don't start new processes if paused
@@ -92,9 +151,17 @@ def sync_processes():
         return
 
     current_files = {f.name: f for f in discover_python_files()}
+    for fname in [n for n in killed if n not in current_files]:
+        del killed[fname]  # removed since the kill: a new copy starts normally
 
     # Start newly added files
     for fname, fpath in current_files.items():
+        if fname in pending_restarts:
+            continue  # exited recently; restart_due() owns it until its backoff elapses
+        if fname in killed:
+            if killed[fname] == _mtime_ns(fpath):
+                continue  # stopped by a kill marker and not rewritten since
+            del killed[fname]
         with lock:
             running = fname in processes
         if not running:
@@ -114,13 +181,20 @@ def check_kill_markers():
     """
     Manager creates: stop/<script_name>.kill
     Example: stop/mybot.py.kill
-    We terminate only that script, delete the marker after stopping.
+    We terminate only that script, delete the marker after stopping. The script then stays
+    stopped, in both watch modes, until its file is written again or removed (or the runner
+    restarts), so the manager's stop-then-delete never races a restart.
     """
     if not STOP_DIR.exists():
         return
     for kill_path in STOP_DIR.glob("*.kill"):
         # For "foo.py.kill" → stem == "foo.py"
         target_script = kill_path.stem
+        pending_restarts.pop(target_script, None)
+        # Whether it is running, waiting out a restart backoff or not started yet
+        mtime = _mtime_ns(WATCH_DIR / target_script)
+        if mtime:
+            killed[target_script] = mtime
         with lock:
             has_proc = target_script in processes
         if has_proc:
@@ -160,6 +234,48 @@ def heartbeat_thread(interval_sec: int = 5):
         write_heartbeat_once()
         time.sleep(interval_sec)
 
+# ──────────────────────────────────────────────────────────────────────────────
+# Filesystem events (inotify)
+# ──────────────────────────────────────────────────────────────────────────────
+def open_watch():
+    """Watch WATCH_DIR and STOP_DIR; returns (inotify, stop_wd) or None to poll instead."""
+    if INotify is None:
+        return None
+    try:
+        ino = INotify()
+        # CLOSE_WRITE rather than CREATE so a script is only started once fully written;
+        # the manager's atomic copy shows up as MOVED_TO.
+        ino.add_watch(str(WATCH_DIR), flags.CLOSE_WRITE | flags.MOVED_TO | flags.DELETE | flags.MOVED_FROM)
+        stop_wd = ino.add_watch(str(STOP_DIR), flags.CLOSE_WRITE | flags.MOVED_TO)
+        return ino, stop_wd
+    except OSError as e:
+        print(f"[WARN] inotify unavailable ({e}), polling every {POLL_SEC}s", flush=True)
+        return None
+
+def handle_events(events, stop_wd):
+    """Dispatch .py add/remove straight to start/stop; pause and kill markers use their checks."""
+    resync = False
+    kill = False
+    for ev in events:
+        if ev.mask & flags.Q_OVERFLOW:
+            resync = True  # events were dropped; rescan everything
+        elif ev.wd == stop_wd:
+            kill = True
+        elif ev.name == PAUSE_MARKER.name:
+            resync = True
+        elif ev.name.endswith(".py") and ev.name != SELF_NAME:
+            if ev.mask & (flags.DELETE | flags.MOVED_FROM):
+                killed.pop(ev.name, None)
+                stop_process(ev.name, reason="file-removed")
+            elif not paused:
+                killed.pop(ev.name, None)  # written again: a kill marker no longer holds it
+                start_process(WATCH_DIR / ev.name)
+    if resync:
+        check_pause_state()
+        sync_processes()
+    if kill:
+        check_kill_markers()
+
 # ──────────────────────────────────────────────────────────────────────────────
 # Signals & main loop
 # ──────────────────────────────────────────────────────────────────────────────
@@ -168,27 +284,73 @@ def handle_shutdown(signum, frame):
     print(f"[INFO] Received signal {signum}, shutting down...", flush=True)
     shutdown = True
 
+def handle_sigchld(signum, frame):
+    # Runs on the main thread between bytecodes, possibly while `lock` is held: only flag it.
+    global child_exited
+    child_exited = True
+
 def main():
     # Ensure stop/ exists (manager will create if needed, but we can too)
     STOP_DIR.mkdir(exist_ok=True)
 
-    # Signals
+    # Signals. The wakeup fd gets a byte on every signal, so the selector below returns at once
+    # for SIGCHLD/SIGTERM instead of at its timeout.
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_r, False)
+    os.set_blocking(wake_w, False)
+    signal.set_wakeup_fd(wake_w)
     signal.signal(signal.SIGTERM, handle_shutdown)
     signal.signal(signal.SIGINT, handle_shutdown)
+    signal.signal(signal.SIGCHLD, handle_sigchld)
 
     # Start heartbeat writer
     hb = threading.Thread(target=heartbeat_thread, args=(5,), daemon=True)
     hb.start()
 
-    print("[INFO] Auto-runner started. Watching for Python files...", flush=True)
+    watch = open_watch()
+    mode = "inotify" if watch else f"polling every {POLL_SEC}s"
+    print(f"[INFO] Auto-runner started. Watching for Python files ({mode})...", flush=True)
+
+    # One full pass picks up whatever is already there
+    check_pause_state()
+    sync_processes()
+    check_kill_markers()
 
-    # Main loop
+    sel = selectors.DefaultSelector()
+    sel.register(wake_r, selectors.EVENT_READ)
+    if watch is not None:
+        sel.register(watch[0].fileno(), selectors.EVENT_READ)
+    next_poll = time.monotonic() + POLL_SEC
+
+    # Main loop: block until a filesystem event or a signal arrives
+    global child_exited
     while not shutdown:
-        check_pause_state()
-        sync_processes()
-        reap_exited_children()
-        check_kill_markers()
-        time.sleep(2)
+        timeout = POLL_SEC if watch is None else 1.0
+        if pending_restarts:
+            timeout = max(0.0, min(timeout, min(pending_restarts.values()) - time.monotonic()))
+        for key, _ in sel.select(timeout=timeout):
+            if key.fd == wake_r:
+                try:
+                    while os.read(wake_r, 512):
+                        pass
+                except BlockingIOError:
+                    pass
+            else:
+                ino, stop_wd = watch
+                handle_events(ino.read(timeout=0), stop_wd)
+        if watch is None and time.monotonic() >= next_poll:
+            check_pause_state()
+            sync_processes()
+            check_kill_markers()
+            next_poll = time.monotonic() + POLL_SEC
+        if child_exited:
+            child_exited = False
+            reap_exited_children()
+        restart_due()
+
+    sel.close()
+    if watch is not None:
+        watch[0].close()
 
     # Cleanup
     with lock:
@@ -1,11 +1,57 @@
 #!/usr/bin/env python3
+"""
+Project auto-runner: starts every *.py dropped next to this file, stops it when the
+file goes away, honours the manager's pause.marker / stop/*.kill files and writes
+heartbeat.json for the manager's health check.
+
+Tuning (env)
+  COSMIC_WATCH       inotify (default) | poll. Use poll on NFS/CIFS/shared folders,
+                     where inotify events are not delivered.
+  COSMIC_POLL_SEC    poll-mode interval, default 2. Also the delay before an exited
+                     script is restarted. Raise it on slow VM/shared-folder mounts to
+                     cut idle wakeups; lower it for snappier demos. `--latency/-l`
+                     on the command line overrides it.
+  COSMIC_RESCAN_SEC  unconditional full pass, default 60. In inotify mode this is the
+                     only timer, a safety net for missed events; it can be large.
+  COSMIC_HB_SEC      heartbeat interval, default 5. Keep it well under the manager's
+                     HEARTBEAT_TTL (30s).
+  COSMIC_HB_JOURNAL  1: append each heartbeat to heartbeat.jsonl (one JSON record per
+                     line, rotated at 10 MB) instead of replacing heartbeat.json, which
+                     keeps a history to grep; the manager reads the last line.
+  COSMIC_POOL_SIZE   opt-in, default 0 (off). N > 0: scripts that define a module-level
+                     `def run():` are imported and run() in a shared pool of N workers
+                     instead of each paying for its own interpreter; when run() returns
+                     the task is rescheduled like an exited script. A run() that never
+                     returns holds its worker for good, and at most N tasks are in
+                     flight: further run() scripts wait (not started, not in the
+                     heartbeat) until a worker frees up.
+"""
 import os
+import sys
+import shutil
+import argparse
 import time
 import json
+import errno
+import select
 import signal
+import struct
+import ctypes
+import ctypes.util
+import queue
+import re
+import importlib.util
+import itertools
+import multiprocessing
 import subprocess
 import threading
 from pathlib import Path
+from types import MappingProxyType
+
+try:
+    import orjson  # C serializer, returns bytes; optional
+except ImportError:
+    orjson = None
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Paths & globals
@@ -14,98 +60,408 @@ WATCH_DIR = Path(__file__).parent.resolve()
 STOP_DIR = WATCH_DIR / "stop"            # manager will drop *.kill files here
 PAUSE_MARKER = WATCH_DIR / "pause.marker"  # manager creates this to pause
 HEARTBEAT_FILE = WATCH_DIR / "heartbeat.json"
+HEARTBEAT_JOURNAL = WATCH_DIR / "heartbeat.jsonl"  # COSMIC_HB_JOURNAL=1: append-only history instead
+
+# See the module docstring for the tradeoffs
+WATCH_MODE = os.getenv("COSMIC_WATCH", "inotify").strip().lower()
+POLL_SEC = float(os.getenv("COSMIC_POLL_SEC", "2"))       # poll-mode tick
+RESCAN_SEC = float(os.getenv("COSMIC_RESCAN_SEC", "60"))  # full pass: safety net for missed events / unchanged mtimes
+HB_SEC = float(os.getenv("COSMIC_HB_SEC", "5"))           # heartbeat interval
+HB_JOURNAL = os.getenv("COSMIC_HB_JOURNAL", "0").strip() == "1"
+HB_JOURNAL_MAX = 10 * 1024 * 1024                         # rotate heartbeat.jsonl past this size
+
+# GIL switch interval (default 5ms). Every thread here is IO-bound: the main loop sleeps in
+# epoll_wait/Event.wait, the heartbeat threads wake every HB_SEC, so forced 5ms hand-offs only
+# cost context switches. Signal handlers are unaffected: they run on the main thread as soon as
+# it is back in the interpreter, and a blocked wait returns through WAKE_FD / stop_event.
+SWITCH_INTERVAL = 0.05
 
-# Map: filename -> subprocess.Popen
+# Same interpreter as the runner, resolved once: no PATH search / shim per spawn
+PYTHON = sys.executable or shutil.which("python3") or "python"
+
+# Scripts with a module-level `def run():` run as tasks in a pool of this many workers (0: never)
+POOL_SIZE = int(os.getenv("COSMIC_POOL_SIZE", "0"))
+_RUN_ENTRY = re.compile(rb"^def run\(\s*\)", re.M)
+
+# Map: filename -> (kind, handle): ("proc", Popen) or ("task", AsyncResult).
+# Mutated only under `lock`; each mutation republishes processes_view, a read-only copy that
+# readers use without the lock (rebinding a global is atomic under the GIL).
 processes = {}
+processes_view = MappingProxyType({})
+# Set by the SIGCHLD handler; the main loop, which owns `processes`, then polls the Popens.
+# Reaping stays with Popen, so it never signals a pid that was reaped (and maybe reused).
+_child_exited = False
+# (filename, 0 | exception) from the pool's result thread; drained alongside exited children
+tasks_done = queue.SimpleQueue()
+_pool = None          # multiprocessing pool for run()-style scripts, created on first use
+_task_pids_q = None   # workers report (token, worker pid) here when a task starts
+task_pids = {}        # filename -> pid of the pool worker running it
+# Each submission gets a fresh token, so a report is matched to the submission it belongs to
+_task_seq = itertools.count(1)
+task_tokens = {}      # filename -> token of its submitted, not yet finished/stopped task
+# Shared with the workers and only touched under _claim_lock: a (token, pid) slot per task a
+# worker is running, and a ring of the most recent tokens stopped before any worker claimed them
+_claim_lock = None
+_claims = None
+_cancelled_ring = None
+_CANCEL_RING = 64
+_cancel_slot = itertools.count()
+pool_waiting = set()  # run() scripts held back because every worker is taken (logged once)
+# filename -> pid (a task only once its worker reports it picked the task up), kept in step
+# with `processes` under `lock` so the heartbeat copies it instead of walking the table
+_pids = {}
 lock = threading.Lock()
-shutdown = False
+# Set by the signal handler; waits on it (and epoll on WAKE_FD) return at once instead of on their timeout
+stop_event = threading.Event()
+WAKE_FD = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
 paused = False
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Discovery & process control
 # ──────────────────────────────────────────────────────────────────────────────
+_MAIN = os.path.basename(__file__)
+
 def discover_python_files():
-    """All .py in WATCH_DIR except this file (main.py)."""
-    return [f for f in WATCH_DIR.glob("*.py") if f.name != Path(__file__).name]
+    """{filename: path} of all .py in WATCH_DIR except this file (main.py)."""
+    # scandir: one getdents pass, d_type answers is_file() without a stat per entry
+    with os.scandir(WATCH_DIR) as it:
+        return {e.name: e.path for e in it
+                if e.name.endswith(".py") and e.name != _MAIN
+                and e.is_file(follow_symlinks=False)}
 
-def start_process(filepath: Path):
+def _publish():
+    """Republish processes_view after a mutation; caller holds `lock`."""
+    global processes_view
+    processes_view = MappingProxyType(processes.copy())
+
+def _snapshot():
+    """The latest published process table, lock-free; callers check against it, then mutate under one lock."""
+    return processes_view
+
+# ── run()-style scripts: executed as tasks in a shared worker pool ──
+def has_run_entry(filepath: str) -> bool:
+    """True if the script defines a module-level `def run():` (and so can run as a pool task)."""
+    try:
+        with open(filepath, "rb") as f:
+            return _RUN_ENTRY.search(f.read()) is not None
+    except OSError:
+        return False
+
+def _get_pool():
+    """The task pool, created on first use; spawn, so no worker is a fork of this threaded runner."""
+    global _pool, _task_pids_q, _claim_lock, _claims, _cancelled_ring
+    if _pool is None:
+        ctx = multiprocessing.get_context("spawn")
+        _task_pids_q = ctx.SimpleQueue()
+        _claim_lock = ctx.Lock()
+        _claims = ctx.RawArray("q", 2 * POOL_SIZE)
+        _cancelled_ring = ctx.RawArray("q", _CANCEL_RING)
+        _pool = ctx.Pool(processes=POOL_SIZE, initializer=_pool_init,
+                         initargs=(_task_pids_q, _claim_lock, _claims, _cancelled_ring))
+        print(f"[INFO] Task pool started ({POOL_SIZE} workers)", flush=True)
+    return _pool
+
+def _pool_init(q, claim_lock, claims, ring):
+    global _task_pids_q, _claim_lock, _claims, _cancelled_ring
+    # Own session, like the Popen'd scripts: a signal to the runner's process group reaches
+    # the runner, which shuts the pool down in order, and not the workers under it
+    try:
+        os.setsid()
+    except OSError:
+        pass
+    _task_pids_q = q
+    _claim_lock = claim_lock
+    _claims = claims
+    _cancelled_ring = ring
+
+def _free_claim():
+    """Index of a claim slot no live worker holds; caller holds _claim_lock."""
+    for i in range(0, len(_claims), 2):
+        if _claims[i] == 0:
+            return i
+        try:
+            os.kill(_claims[i + 1], 0)
+        except ProcessLookupError:
+            return i  # left by a worker that died mid-task
+        except PermissionError:
+            pass
+    raise RuntimeError("no free task claim slot")
+
+def _run_task(name: str, filepath: str, token: int):
+    """Pool worker: claim the task unless it was stopped while queued, then import it and call run()."""
+    pid = os.getpid()
+    with _claim_lock:
+        if token in _cancelled_ring[:]:
+            return
+        slot = _free_claim()
+        _claims[slot], _claims[slot + 1] = token, pid
+        # Reported under the lock too: a worker killed mid-put would leave the queue's write lock held
+        _task_pids_q.put((token, pid))
+    try:
+        spec = importlib.util.spec_from_file_location(f"cosmic_task_{name[:-3]}", filepath)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.run()
+    finally:
+        with _claim_lock:
+            if _claims[slot] == token:
+                _claims[slot] = _claims[slot + 1] = 0
+
+def _task_finished(name, code):
+    # Runs on the pool's result thread: queue for the main loop and wake it, like SIGCHLD
+    tasks_done.put((name, code))
+    try:
+        os.eventfd_write(WAKE_FD, 1)
+    except OSError:
+        pass
+
+def _drain_task_pids():
+    """Fold pending worker start reports into task_pids and _pids; caller holds `lock`."""
+    while not _task_pids_q.empty():
+        token, pid = _task_pids_q.get()
+        n = next((n for n, t in task_tokens.items() if t == token), None)
+        if n is None:
+            continue  # its task already finished or was stopped
+        task_pids[n] = pid
+        entry = processes.get(n)
+        if entry is not None and entry[0] == "task":
+            _pids[n] = pid
+
+def start_process(filepath: str):
+    name = os.path.basename(filepath)
     with lock:
-        if filepath.name in processes:
+        if name in processes:
+            return
+        if POOL_SIZE > 0 and has_run_entry(filepath):
+            # Never queue behind busy workers: a queued task would look started but not run
+            if sum(1 for kind, _h in processes.values() if kind == "task") >= POOL_SIZE:
+                if name not in pool_waiting:
+                    pool_waiting.add(name)
+                    print(f"[INFO] {name} waiting for a free pool worker", flush=True)
+                return
+            pool_waiting.discard(name)
+            print(f"[INFO] Starting {name} (pool task) ...", flush=True)
+            task_pids.pop(name, None)
+            task_tokens[name] = token = next(_task_seq)
+            res = _get_pool().apply_async(
+                _run_task, (name, filepath, token),
+                callback=lambda _r, n=name: _task_finished(n, 0),
+                error_callback=lambda e, n=name: _task_finished(n, e),
+            )
+            processes[name] = ("task", res)
+            _publish()
             return
-        print(f"[INFO] Starting {filepath.name} ...", flush=True)
+        print(f"[INFO] Starting {name} ...", flush=True)
         proc = subprocess.Popen(
-            ["python", str(filepath)],
+            [PYTHON, "-u", filepath],  # -u: unbuffered, so output reaches docker logs as it happens
             stdout=None,  # inherit → visible in docker logs
-            stderr=None
+            stderr=None,
+            close_fds=True,  # never leak the inotify/eventfd/epoll fds into scripts
+            start_new_session=True,  # own process group, so killpg also reaches workers it spawns
         )
-        processes[filepath.name] = proc
+        processes[name] = ("proc", proc)
+        _pids[name] = proc.pid
+        _publish()
+
+def _signal_group(proc, sig):
+    """Signal the child's whole session (it is its group leader) so grandchildren go too."""
+    # Even after the leader exited: while any grandchild is left the group id can't be reused
+    try:
+        os.killpg(proc.pid, sig)
+    except ProcessLookupError:
+        pass
+
+def _stop_task(name: str, res):
+    """Kill the worker running a pool task (the pool replaces it), or cancel the task if none has claimed it."""
+    with lock:
+        task_pids.pop(name, None)
+        token = task_tokens.pop(name, None)
+    if _pool is None or token is None or res.ready():
+        # Pool already terminated, or run() returned and its worker is idle again. An idle
+        # worker holds the task queue's read lock; killing it would deadlock pool.terminate()
+        return
+    with _claim_lock:
+        # A claimed token's worker can't leave _run_task while we hold the lock, so it isn't idle
+        for i in range(0, len(_claims), 2):
+            if _claims[i] == token:
+                try:
+                    os.kill(_claims[i + 1], signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+                _claims[i] = _claims[i + 1] = 0
+                return
+        _cancelled_ring[next(_cancel_slot) % _CANCEL_RING] = token
 
 def stop_process(filename: str, reason: str = "regular"):
     with lock:
-        proc = processes.pop(filename, None)
-    if proc is None:
+        entry = processes.pop(filename, None)
+        if entry is not None:
+            _pids.pop(filename, None)
+            _publish()
+    if entry is None:
         return
+    kind, proc = entry
     print(f"[INFO] Stopping {filename} ({reason}) ...", flush=True)
+    if kind == "task":
+        _stop_task(filename, proc)
+        return
     try:
-        proc.terminate()
+        _signal_group(proc, signal.SIGTERM)
         proc.wait(timeout=5)
     except subprocess.TimeoutExpired:
-        proc.kill()
+        _signal_group(proc, signal.SIGKILL)
         proc.wait()
     except Exception as e:
         print(f"[WARN] Error stopping {filename}: {e}", flush=True)
 
-def reap_exited_children():
-    """Remove from table any processes that have naturally exited."""
-    dead = []
+def stop_all(reason: str, names=None):
+    """SIGTERM every script's group (or just `names`) first, then wait on all against one shared 5s deadline."""
+    with lock:
+        if names is None:
+            items = list(processes.items())
+            processes.clear()
+            _pids.clear()
+        else:
+            items = [(n, processes.pop(n)) for n in names if n in processes]
+            for n, _entry in items:
+                _pids.pop(n, None)
+        _publish()
+    procs = []
+    for filename, (kind, handle) in items:
+        print(f"[INFO] Stopping {filename} ({reason}) ...", flush=True)
+        if kind == "task":
+            _stop_task(filename, handle)
+        else:
+            _signal_group(handle, signal.SIGTERM)
+            procs.append((filename, handle))
+    deadline = time.monotonic() + 5
+    for filename, proc in procs:
+        try:
+            proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            _signal_group(proc, signal.SIGKILL)
+            proc.wait()
+        except Exception as e:
+            print(f"[WARN] Error stopping {filename}: {e}", flush=True)
+
+def _on_sigchld(signum, frame):
+    # Only flag and poke WAKE_FD: handlers may interrupt the main thread mid-mutation, and a
+    # waitpid(-1) here would reap children behind Popen's back
+    global _child_exited
+    _child_exited = True
+    try:
+        os.eventfd_write(WAKE_FD, 1)
+    except OSError:
+        pass
+
+def _reap_procs():
+    """Poll every tracked Popen and drop the exited ones; [(filename, exit code)]."""
+    dead = [(name, handle) for name, (kind, handle) in _snapshot().items()
+            if kind == "proc" and handle.poll() is not None]
+    if not dead:
+        return []
+    gone = []
     with lock:
-        for name, proc in processes.items():
-            if proc.poll() is not None:
-                dead.append(name)
-    for name in dead:
-        print(f"[INFO] {name} exited with code {processes[name].returncode}", flush=True)
+        for name, proc in dead:
+            entry = processes.get(name)
+            if entry is not None and entry[1] is proc:
+                del processes[name]
+                _pids.pop(name, None)
+                gone.append((name, proc.returncode))
+        _publish()
+    return gone
+
+def drain_exited():
+    """Drop scripts that exited (procs after a SIGCHLD, finished pool tasks) from the table;
+    True if any tracked script exited."""
+    global _child_exited
+    dead = []
+    if _child_exited:
+        _child_exited = False  # before polling: a child exiting meanwhile flags the next pass
+        dead.extend(_reap_procs())
+    while True:
+        try:
+            name, code = tasks_done.get_nowait()
+        except queue.Empty:
+            break
         with lock:
-            processes.pop(name, None)
+            entry = processes.get(name)
+            if entry is None or entry[0] != "task" or not entry[1].ready():
+                continue  # stopped (and maybe restarted) meanwhile; this result is stale
+            del processes[name]
+            _pids.pop(name, None)
+            task_tokens.pop(name, None)
+            _publish()
+        task_pids.pop(name, None)
+        dead.append((name, code))
+    for name, code in dead:
+        if isinstance(code, BaseException):
+            print(f"[WARN] {name} run() raised {code!r}", flush=True)
+        else:
+            print(f"[INFO] {name} exited with code {code}", flush=True)
+    return bool(dead)
+
+def reap_exited_children():
+    """Safety net for exits SIGCHLD missed: poll every Popen; True if any had exited."""
+    dead = _reap_procs()
+    for name, code in dead:
+        print(f"[INFO] {name} exited with code {code}", flush=True)
+    return bool(dead)
 
 def check_pause_state():
     """Check if pause marker exists and update global state."""
-    global paused
+    global paused, _sync_sig
     was_paused = paused
     paused = PAUSE_MARKER.exists()
+    if paused != was_paused:
+        _sync_sig = None  # the next sync must run in full
 
     # If we just got paused, stop all processes
     if paused and not was_paused:
         print("[INFO] Pause marker detected - stopping all processes...", flush=True)
-        with lock:
-            names = list(processes.keys())
-        for fname in names:
-            stop_process(fname, reason="paused")
+        stop_all("paused")
 
     # If we just got resumed, sync will restart them
     if not paused and was_paused:
         print("[INFO] Pause marker removed - resuming operations...", flush=True)
 
-def sync_processes():
+# (frozenset of script names, processes_view) as of the last sync. processes_view is republished
+# on every start/stop/exit, so identity tells whether the table moved.
+_sync_sig = None
+# Scripts stopped by a kill marker stay down until their file is written again or removed:
+# filename -> st_mtime_ns at kill time (main thread only)
+killed = {}
+
+def sync_processes(force: bool = False):
     """Start new files, stop deleted ones (unless paused)."""
+    global _sync_sig
     # Don't start new processes if paused
     if paused:
         return
 
-    current_files = {f.name: f for f in discover_python_files()}
+    current_files = discover_python_files()
+    names = frozenset(current_files)
+    snap = _snapshot()
+    # Same scripts on disk, same process table: nothing to start or stop (the steady state).
+    # Not while scripts are held by a kill: a rewrite changes neither.
+    if (not force and not killed and _sync_sig is not None
+            and _sync_sig[0] == names and _sync_sig[1] is snap):
+        return
+    for fname in list(killed):
+        if fname not in names or killed[fname] != _mtime_ns(current_files[fname]):
+            del killed[fname]  # removed or rewritten since the kill
+    to_start = [current_files[fname] for fname in names - snap.keys() if fname not in killed]
+    to_stop = list(snap.keys() - names)
+    pool_waiting.intersection_update(names)
 
-    # Start newly added files
-    for fname, fpath in current_files.items():
-        with lock:
-            running = fname in processes
-        if not running:
-            start_process(fpath)
+    # Stop processes whose file was removed first, so a pool worker they free is reused below
+    for fname in to_stop:
+        stop_process(fname, reason="file-removed")
 
-    # Stop processes whose file was removed
-    with lock:
-        running_names = list(processes.keys())
-    for fname in running_names:
-        if fname not in current_files:
-            stop_process(fname, reason="file-removed")
+    # Start newly added files
+    for fpath in to_start:
+        start_process(fpath)
+    _sync_sig = (names, _snapshot())
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Kill-marker handling (manager → project)
@@ -114,91 +470,406 @@ def check_kill_markers():
     """
     Manager creates: stop/<script_name>.kill
     Example: stop/mybot.py.kill
-    We terminate only that script, delete the marker after stopping.
+    We terminate only that script, delete the marker after stopping. The script then stays
+    stopped, in both watch modes, until its file is written again or removed (or the runner
+    restarts), so the manager's stop-then-delete never races a restart.
     """
-    if not STOP_DIR.exists():
+    try:
+        with os.scandir(STOP_DIR) as it:
+            markers = [(e.name, e.path) for e in it if e.name.endswith(".kill")]
+    except FileNotFoundError:
         return
-    for kill_path in STOP_DIR.glob("*.kill"):
-        # For "foo.py.kill" → stem == "foo.py"
-        target_script = kill_path.stem
-        with lock:
-            has_proc = target_script in processes
-        if has_proc:
-            print(f"[INFO] Kill marker found for {target_script}", flush=True)
-            stop_process(target_script, reason="kill-marker")
-        # Clean up the marker whether or not the proc existed
+    if not markers:
+        return
+    # For "foo.py.kill" → "foo.py". Every target whose file exists is marked, running or not
+    # (an exited script waiting on resync would otherwise be restarted)
+    for name, _path in markers:
+        mtime = _mtime_ns(WATCH_DIR / name[:-len(".kill")])
+        if mtime:
+            killed[name[:-len(".kill")]] = mtime
+    # Fan SIGTERM out to every running target at once, then wait together
+    snap = _snapshot()
+    targets = [name[:-len(".kill")] for name, _path in markers if name[:-len(".kill")] in snap]
+    for target_script in targets:
+        print(f"[INFO] Kill marker found for {target_script}", flush=True)
+    if targets:
+        stop_all("kill-marker", names=targets)
+    # Clean up all markers in one tight pass, whether or not the proc existed
+    for marker_name, marker_path in markers:
         try:
-            kill_path.unlink()
+            os.unlink(marker_path)
+        except FileNotFoundError:
+            pass
         except Exception as e:
-            print(f"[WARN] Could not remove kill marker {kill_path.name}: {e}", flush=True)
+            print(f"[WARN] Could not remove kill marker {marker_name}: {e}", flush=True)
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Heartbeat (project → manager)
 # ──────────────────────────────────────────────────────────────────────────────
-def write_heartbeat_once():
-    with lock:
-        pids = {name: proc.pid for name, proc in processes.items()}
-    status = "paused" if paused else "running"
-    payload = {"ts": time.time(), "pids": pids, "status": status}
+hb_lock = threading.Lock()  # heartbeat thread and the final write from main() never overlap
+_last_hb_sig = None  # (pids fragment, status) of the last written payload, i.e. all but "ts"
+_hb_fd = None        # O_APPEND fd on heartbeat.jsonl, journal mode only
+_hb_pids = None      # pids of the last heartbeat built, and its serialized JSON below
+_hb_pids_frag = b"{}"
+# The heartbeat schema is fixed: only the pids fragment (re-serialized when pids change), status
+# and ts are filled in. Keys in _dumps' sorted order; %a on a float is its repr, as json emits.
+_HB_TEMPLATE = b'{"pids":%b,"status":"%b","ts":%a}'
+hb_q = queue.SimpleQueue()  # (ts, pids, status) from the collector to the writer; None ends the writer
+
+def _dumps(obj) -> bytes:
+    """Compact, key-sorted JSON bytes (orjson when installed)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, separators=(",", ":"), sort_keys=True).encode()
 
-    # Atomic write to avoid partial reads
+def _open_tmp_excl(path: Path) -> int:
+    flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY | os.O_CLOEXEC
+    try:
+        return os.open(path, flags, 0o644)
+    except FileExistsError:
+        # Writers are serialized by hb_lock, so an existing tmp is debris from a crashed run
+        os.unlink(path)
+        return os.open(path, flags, 0o644)
+
+def _fsync_dir():
+    dirfd = os.open(WATCH_DIR, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(dirfd)
+    finally:
+        os.close(dirfd)
+
+# Linux O_TMPFILE: the payload is written to an unnamed inode, so a crash mid-write leaves no
+# heartbeat.json.tmp behind. Cleared on the first filesystem, /proc or sandbox that refuses it.
+_use_tmpfile = hasattr(os, "O_TMPFILE")
+_TMPFILE_UNSUPPORTED = (errno.EOPNOTSUPP, errno.EISDIR, errno.EINVAL, errno.ENOENT, errno.EXDEV)
+
+def _replace_heartbeat_tmpfile(data: bytes):
+    # unnamed fd -> write+fsync -> linkat via /proc/self/fd -> rename over -> fsync dir
+    fd = os.open(WATCH_DIR, os.O_TMPFILE | os.O_WRONLY | os.O_CLOEXEC, 0o644)
+    new = HEARTBEAT_FILE.with_suffix(".json.new")
+    try:
+        os.write(fd, data)
+        os.fsync(fd)
+        try:
+            os.link(f"/proc/self/fd/{fd}", new, follow_symlinks=True)
+        except FileExistsError:
+            os.unlink(new)  # debris from a crash between link and rename
+            os.link(f"/proc/self/fd/{fd}", new, follow_symlinks=True)
+    finally:
+        os.close(fd)
+    os.replace(new, HEARTBEAT_FILE)
+    _fsync_dir()
+
+def _replace_heartbeat(data: bytes):
+    # Durable atomic write: exclusive tmp -> fsync -> rename -> fsync dir,
+    # so the manager sees the old or the new heartbeat, never a torn or empty one
+    global _use_tmpfile
+    if _use_tmpfile:
+        try:
+            return _replace_heartbeat_tmpfile(data)
+        except OSError as e:
+            if e.errno not in _TMPFILE_UNSUPPORTED:
+                raise
+            _use_tmpfile = False
+            print(f"[INFO] O_TMPFILE unavailable ({e}); using heartbeat.json.tmp", flush=True)
     tmp = HEARTBEAT_FILE.with_suffix(".json.tmp")
     try:
-        with open(tmp, "w") as f:
-            json.dump(payload, f)
+        fd = _open_tmp_excl(tmp)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
         os.replace(tmp, HEARTBEAT_FILE)
-    except Exception as e:
-        print(f"[WARN] Heartbeat write failed: {e}", flush=True)
+        _fsync_dir()
+    except Exception:
         try:
             if tmp.exists():
                 tmp.unlink()
         except Exception:
             pass
+        raise
+
+def _append_journal(data: bytes):
+    # One O_APPEND write per record: a line this short is written atomically, so the
+    # manager's last-line read never sees half a record; no rename, no dir journal commit
+    global _hb_fd
+    if _hb_fd is not None and os.fstat(_hb_fd).st_size >= HB_JOURNAL_MAX:
+        _rotate_journal()
+    if _hb_fd is None:
+        _hb_fd = os.open(HEARTBEAT_JOURNAL, os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_CLOEXEC, 0o644)
+    os.write(_hb_fd, data + b"\n")
+    os.fsync(_hb_fd)
 
-def heartbeat_thread(interval_sec: int = 5):
-    while not shutdown:
-        write_heartbeat_once()
-        time.sleep(interval_sec)
+def _rotate_journal():
+    """Rotation stub: move the full journal aside (timestamped); the next append starts a fresh one."""
+    global _hb_fd
+    os.rename(HEARTBEAT_JOURNAL, WATCH_DIR / f"heartbeat.{time.strftime('%Y%m%d-%H%M%S')}.jsonl")
+    os.close(_hb_fd)
+    _hb_fd = None
+
+def _heartbeat_state():
+    """What the heartbeat reports right now: (ts, pids, status)."""
+    if _task_pids_q is not None and not _task_pids_q.empty():
+        with lock:
+            _drain_task_pids()
+    # dict.copy() is atomic under the GIL; a view one mutation behind is fine for a heartbeat
+    return time.time(), _pids.copy(), "paused" if paused else "running"
+
+def _write_heartbeat(ts: float, pids: dict, status: str):
+    global _last_hb_sig, _hb_pids, _hb_pids_frag
+    target = HEARTBEAT_JOURNAL if HB_JOURNAL else HEARTBEAT_FILE
+
+    with hb_lock:
+        if pids != _hb_pids:
+            _hb_pids, _hb_pids_frag = pids, _dumps(pids)
+        status_b = status.encode()
+        sig = (_hb_pids_frag, status_b)
+        if sig == _last_hb_sig:
+            # Nothing but ts would change: refresh the mtime (the manager reads max(ts, mtime)) and skip the write
+            try:
+                os.utime(target, None)
+                return
+            except OSError:
+                pass  # file went missing; rewrite it below
+        try:
+            data = _HB_TEMPLATE % (_hb_pids_frag, status_b, ts)
+            if HB_JOURNAL:
+                _append_journal(data)
+            else:
+                _replace_heartbeat(data)
+            _last_hb_sig = sig
+        except Exception as e:
+            print(f"[WARN] Heartbeat write failed: {e}", flush=True)
+
+def write_heartbeat_once():
+    _write_heartbeat(*_heartbeat_state())
+
+def heartbeat_thread(interval_sec: float = HB_SEC):
+    """Collector: snapshot state on a steady cadence; a slow fsync in the writer can't make it drift."""
+    while True:
+        hb_q.put(_heartbeat_state())
+        if stop_event.wait(interval_sec):
+            break
+    hb_q.put(None)
+
+def heartbeat_writer():
+    """Writer: persist only the newest queued snapshot; older ones that piled up behind a stall are dropped."""
+    while True:
+        item = hb_q.get()
+        while item is not None and not hb_q.empty():
+            item = hb_q.get_nowait()
+        if item is None:
+            return
+        _write_heartbeat(*item)
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Filesystem watching (raw inotify via libc, epoll-driven)
+# ──────────────────────────────────────────────────────────────────────────────
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+_IN_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; followed by len bytes of NUL-padded name
+
+def open_inotify():
+    """inotify fd watching WATCH_DIR and STOP_DIR, plus STOP_DIR's wd. Raises OSError if unavailable."""
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    watches = (
+        # IN_CREATE is for pause.marker only (a marker may be linked in without any write)
+        (WATCH_DIR, IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_MOVED_FROM),
+        (STOP_DIR, IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE),
+    )
+    wds = []
+    for path, mask in watches:
+        wd = libc.inotify_add_watch(fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(err, f"inotify_add_watch failed for {path}")
+        wds.append(wd)
+    return fd, wds[1]
+
+def read_inotify(fd):
+    """Drain the non-blocking inotify fd until EAGAIN; yields (wd, mask, name)."""
+    while True:
+        try:
+            buf = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+        off = 0
+        while off < len(buf):
+            wd, mask, _cookie, length = _IN_EVENT.unpack_from(buf, off)
+            off += _IN_EVENT.size
+            name = buf[off:off + length].rstrip(b"\0").decode(errors="surrogateescape")
+            off += length
+            yield wd, mask, name
+
+def watch_fs(fd, stop_wd):
+    """Block in epoll until inotify reports a change, then run only the checks the events call for."""
+    ep = select.epoll()
+    ep.register(fd, select.EPOLLIN)
+    ep.register(WAKE_FD, select.EPOLLIN)
+    check_pause_state()
+    sync_processes()
+    check_kill_markers()
+    last_full = time.monotonic()
+    resync_at = None  # exited scripts restart POLL_SEC after the exit, like a poll tick, not in a hot loop
+    try:
+        while not stop_event.is_set():
+            timeout = RESCAN_SEC - (time.monotonic() - last_full)
+            if resync_at is not None:
+                timeout = min(timeout, resync_at - time.monotonic())
+            try:
+                ready = ep.poll(max(0.0, timeout))
+            except InterruptedError:
+                continue
+            if stop_event.is_set():
+                break
+            pause = sync = kill = full = False
+            ready_fds = {rfd for rfd, _ in ready}
+            if WAKE_FD in ready_fds:
+                try:
+                    os.eventfd_read(WAKE_FD)  # SIGCHLD poke; exits are drained below
+                except BlockingIOError:
+                    pass
+            if fd in ready_fds:
+                for wd, mask, name in read_inotify(fd):
+                    if mask & IN_Q_OVERFLOW:
+                        pause = sync = kill = True
+                    elif wd == stop_wd:
+                        kill = kill or name.endswith(".kill")
+                    elif name == PAUSE_MARKER.name:
+                        pause = sync = True  # resume must restart scripts
+                    elif name.endswith(".py"):
+                        # Not IN_CREATE: that fires when a copy opens the file, before its content
+                        # lands; the copy's IN_CLOSE_WRITE (or the rename's IN_MOVED_TO) follows
+                        sync = sync or not mask & IN_CREATE
+            if time.monotonic() - last_full >= RESCAN_SEC:
+                pause = sync = kill = full = True
+                last_full = time.monotonic()
+            if resync_at is not None and time.monotonic() >= resync_at:
+                sync = True
+            if sync:
+                resync_at = None
+
+            if pause:
+                check_pause_state()
+            if sync:
+                sync_processes(force=full)
+            if (drain_exited() or (full and reap_exited_children())) and resync_at is None:
+                resync_at = time.monotonic() + POLL_SEC
+            if kill:
+                check_kill_markers()
+    finally:
+        ep.close()
+        os.close(fd)
+
+def _mtime_ns(path) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+def poll_fs():
+    """Fallback: every POLL_SEC, rescan whichever directory's mtime moved since the last tick."""
+    last_watch = last_stop = None
+    last_full = time.monotonic()
+    while not stop_event.is_set():
+        # Creating/removing/renaming an entry bumps its directory's mtime; equal mtime means no new
+        # scripts, no pause.marker change and no new kill markers, so one stat replaces stat+readdir
+        watch_m, stop_m = _mtime_ns(WATCH_DIR), _mtime_ns(STOP_DIR)
+        full = time.monotonic() - last_full >= RESCAN_SEC
+        if full:
+            last_watch = last_stop = None
+            last_full = time.monotonic()
+        if watch_m != last_watch:
+            last_watch = watch_m
+            check_pause_state()
+            sync_processes(force=full)
+        elif killed:
+            sync_processes()  # an in-place rewrite of a killed script leaves the dir mtime alone
+        if drain_exited() or (full and reap_exited_children()):
+            sync_processes()  # exited scripts whose file remains restart on the next tick, as before
+        if stop_m != last_stop:
+            last_stop = stop_m
+            check_kill_markers()
+        stop_event.wait(POLL_SEC)
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Signals & main loop
 # ──────────────────────────────────────────────────────────────────────────────
 def handle_shutdown(signum, frame):
-    global shutdown
     print(f"[INFO] Received signal {signum}, shutting down...", flush=True)
-    shutdown = True
+    stop_event.set()
+    try:
+        os.eventfd_write(WAKE_FD, 1)
+    except OSError:
+        pass
 
 def main():
+    global _pool
     # Ensure stop/ exists (manager will create if needed, but we can too)
     STOP_DIR.mkdir(exist_ok=True)
 
     # Signals
     signal.signal(signal.SIGTERM, handle_shutdown)
     signal.signal(signal.SIGINT, handle_shutdown)
+    signal.signal(signal.SIGCHLD, _on_sigchld)
+
+    # Before any thread exists: the main loop keeps the GIL longer between hand-offs
+    sys.setswitchinterval(SWITCH_INTERVAL)
 
-    # Start heartbeat writer
-    hb = threading.Thread(target=heartbeat_thread, args=(5,), daemon=True)
+    # Start heartbeat collector + writer
+    hb = threading.Thread(target=heartbeat_thread, args=(HB_SEC,), daemon=True)
+    hb_writer = threading.Thread(target=heartbeat_writer, daemon=True)
     hb.start()
+    hb_writer.start()
+
+    watch = None
+    if WATCH_MODE != "poll":
+        try:
+            watch = open_inotify()
+        except (OSError, AttributeError) as e:
+            print(f"[WARN] inotify unavailable ({e}); polling every {POLL_SEC}s", flush=True)
 
-    print("[INFO] Auto-runner started. Watching for Python files...", flush=True)
+    print(f"[INFO] Auto-runner started ({'inotify' if watch else 'poll'}). Watching for Python files...", flush=True)
 
     # Main loop
-    while not shutdown:
-        check_pause_state()
-        sync_processes()
-        reap_exited_children()
-        check_kill_markers()
-        time.sleep(2)
-
-    # Cleanup
-    with lock:
-        names = list(processes.keys())
-    for fname in names:
-        stop_process(fname, reason="shutdown")
+    if watch:
+        watch_fs(*watch)
+    else:
+        poll_fs()
+
+    # Cleanup. Pool first: terminate() ends all workers together, while killing them one by one
+    # could leave an idle one dead with the task queue's lock, and terminate() would hang on it
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+        _pool = None
+    stop_all("shutdown")
 
-    # Final heartbeat to show empty state
+    # Final heartbeat to show empty state, after the writer has flushed what it had
+    hb_writer.join(timeout=5)
     write_heartbeat_once()
     print("[INFO] All subprocesses stopped. Exiting cleanly.", flush=True)
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Project auto-runner")
+    ap.add_argument("-l", "--latency", type=float, help="poll-mode interval in seconds (overrides COSMIC_POLL_SEC)")
+    args = ap.parse_args()
+    if args.latency:
+        POLL_SEC = args.latency
     main()